@@ -1,12 +1,29 @@
-from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import hashlib
+import logging
+import time
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, List, Union
+from datetime import date, datetime, timezone
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
-from sql import Plants
+import changes
+import crud
+import planning
+import reports
+import search
+from batching import make_group_committers
+from cache import MISSING, make_caches
+from responses import FastJSONResponse
+from config import settings
+from sql import async_engine_report, engine_report, get_async_engine, get_async_sessionmaker, get_engine, Plants, Products, Materials, Orders, OrdersProducts
 
 class PlantBase(BaseModel):
     name: str
@@ -18,67 +35,330 @@ class PlantCreate(PlantBase):
 
 class PlantRead(PlantBase):
     id: int
+    version: int
 
     class Config:
         from_attributes = True
 
+class PlantPage(BaseModel):
+    items: List[PlantRead]
+    next_cursor: Optional[int] = None
+    missing: Optional[List[int]] = None
+
 class PlantUpdate(BaseModel):
     name: Optional[str] = None
     location: Optional[str] = None
     capacity: Optional[int] = None
 
-app = FastAPI()
-
-def get_db():
-    db = Session(bind=engine)
+logger = logging.getLogger(__name__)
+# Configured by uvicorn (level INFO, to stderr); this module's own logger is
+# not, so the startup report would otherwise never be shown
+server_logger = logging.getLogger("uvicorn.error")
+
+router = APIRouter()
+
+class SyncDB:
+    # Gives a blocking Session the run_sync() interface of AsyncSession, so the
+    # handlers are the same async functions in both modes; the blocking call
+    # runs in the threadpool, as a sync route would.
+    def __init__(self, session: Session):
+        self.session = session
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(self._call, fn, *args, **kwargs)
+
+    def _call(self, fn, *args, **kwargs):
+        try:
+            return fn(self.session, *args, **kwargs)
+        finally:
+            # Hand the connection back before the worker thread is released;
+            # requests waiting for a thread must not hold the whole pool.
+            self.session.close()
+
+# A SyncDB in sync mode, an AsyncSession in async mode
+Database = SyncDB
+
+async def get_db():
+    if settings.db_mode == "async":
+        async with get_async_sessionmaker()() as session:
+            yield session
+    else:
+        session = Session(bind=get_engine())
+        try:
+            yield SyncDB(session)
+        finally:
+            session.close()
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+MAX_ORDER_LINES = 1000
+
+async def table_etag(db: Database, model, key) -> str:
+    # Strong ETag from the table's change counter: answering a conditional
+    # request only reads TableVersions, never the rows themselves
+    version = await db.run_sync(crud.table_version, model)
+    digest = hashlib.blake2b(str(key).encode(), digest_size=8).hexdigest()
+    return f'"{model.__tablename__}-{version}-{digest}"'
+
+def not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+def split_values(values: Optional[List[str]]) -> Optional[List[str]]:
+    # Accepts both ?status=a&status=b and ?status=a,b
+    if not values:
+        return None
+    return [value.strip() for item in values for value in item.split(",") if value.strip()]
+
+def make_listing(model, conditions=(), sort: Optional[str] = None, after: Optional[str] = None) -> crud.Listing:
+    # Without an explicit sort the filters pick one that an index can serve;
+    # an explicit sort no index can serve with these filters is a 400
+    if sort is None:
+        sort = crud.default_sort(model, conditions)
+    descending = sort.startswith("-")
+    sort = sort.lstrip("-")
+    position = None
+    if after is not None:
+        try:
+            position = crud.decode_cursor(model, sort, after)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    listing = crud.Listing(list(conditions), sort, descending, position)
+    crud.check_index_order(model, listing)
+    return listing
+
+def parse_fields(model, fields: Optional[str]) -> Optional[List[str]]:
+    # Sparse fieldset: "name,price" -> ["id", "name", "price"] (id is always
+    # included, order follows the table); None means every column
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - set(model.__table__.c.keys())
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return [name for name in model.__table__.c.keys() if name in names or name == "id"]
+
+async def list_response(
+    db: Database, request: Request, response: Response,
+    model, schema, limit: int, listing: crud.Listing, stream: bool, fields: Optional[str] = None,
+):
+    # A sparse fieldset is selected as Core columns and encoded as is: the
+    # Read model (which requires every field) is bypassed
+    columns = parse_fields(model, fields)
+    etag = await table_etag(db, model, request.url.query)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if stream:
+        return StreamingResponse(
+            crud.stream_rows(model, schema, limit, listing, fast=settings.fast_responses, columns=columns),
+            media_type="application/json", headers={"ETag": etag},
+        )
+    if settings.fast_responses or columns is not None:
+        page = await db.run_sync(crud.keyset_rows, model, limit, listing, columns)
+        page.pop("position")
+        # same keys as a page validated by the Page model
+        page["missing"] = None
+        return FastJSONResponse(page, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return await db.run_sync(crud.keyset_page, model, limit, listing)
+
+async def write_batch(model, rows: List[dict]) -> list:
+    # One group commit transaction, on a session of its own
+    if settings.db_mode == "async":
+        async with get_async_sessionmaker()() as session:
+            return await session.run_sync(crud.insert_rows_each, model, rows)
+    return await SyncDB(Session(bind=get_engine())).run_sync(crud.insert_rows_each, model, rows)
+
+group_committers = make_group_committers([Plants, Products, Materials, Orders], write_batch)
+
+async def create_response(db: Database, model, payload: BaseModel):
+    if settings.group_commit:
+        return await group_committers[model.__tablename__.lower()].submit(payload.model_dump())
+    return await db.run_sync(crud.create_row, model, payload)
+
+def row_etag(model, row_id: int, version: int) -> str:
+    # Item ETags carry the row version, so that If-Match can be checked by
+    # the UPDATE itself (WHERE version = ?) without reading the row first
+    return f'"{model.__tablename__}-{row_id}-{version}"'
+
+def if_match_version(request: Request, model, row_id: int) -> Optional[int]:
+    # The version an If-Match header asks for; None without the header or
+    # for "*". A tag that is not an ETag of this row can never match: 412.
+    header = request.headers.get("if-match")
+    if header is None:
+        return None
+    prefix = f'"{model.__tablename__}-{row_id}-'
+    for tag in (tag.strip() for tag in header.split(",")):
+        if tag == "*":
+            return None
+        if tag.startswith(prefix) and tag.endswith('"') and tag[len(prefix):-1].isdigit():
+            return int(tag[len(prefix):-1])
+    raise HTTPException(status_code=412, detail="If-Match does not match this resource")
+
+caches = make_caches(["plants", "products", "materials", "orders"])
+
+def cache_for(model):
+    return caches[model.__tablename__.lower()]
+
+async def cached_get(db: Database, model, schema, row_id: int):
+    # Read-through: a miss loads the row and stores its validated Read model
+    cache = cache_for(model)
+    item = cache.get(row_id)
+    if item is MISSING:
+        generation = cache.generation(row_id)
+        row = await db.run_sync(crud.get_row, model, row_id)
+        if not row:
+            return None
+        item = schema.model_validate(row)
+        cache.set(row_id, item, len(item.model_dump_json()), generation)
+    return item
+
+def parse_ids(ids: str) -> List[int]:
+    # "3,1,3,2" -> [3, 1, 2]: request order, each id once
     try:
-        yield db
-    finally:
-        db.close()
-
-from fastapi import FastAPI, Depends, HTTPException
-@app.get('/')
+        values = list(dict.fromkeys(int(value) for value in ids.split(",") if value.strip()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids must be a comma separated list of integers")
+    if not values or len(values) > MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"ids must list between 1 and {MAX_PAGE_SIZE} ids")
+    return values
+
+async def ids_response(db: Database, model, schema, ids: str, fields: Optional[str] = None):
+    # Multi-id lookup: cached items first, then one IN query for the rest.
+    # Items come back in the requested order; unknown ids are listed in
+    # "missing". Served without an ETag, so a fully cached lookup never
+    # touches the database.
+    wanted = parse_ids(ids)
+    columns = parse_fields(model, fields)
+    cache = cache_for(model)
+    found = {}
+    for row_id in wanted:
+        item = cache.get(row_id)
+        if item is not MISSING:
+            found[row_id] = item
+    misses = [row_id for row_id in wanted if row_id not in found]
+    if misses:
+        generations = {row_id: cache.generation(row_id) for row_id in misses}
+        for row in await db.run_sync(crud.get_rows, model, misses):
+            item = schema.model_validate(row)
+            cache.set(row.id, item, len(item.model_dump_json()), generations[row.id])
+            found[row.id] = item
+    page = {
+        "items": [found[row_id] for row_id in wanted if row_id in found],
+        "next_cursor": None,
+        "missing": [row_id for row_id in wanted if row_id not in found],
+    }
+    if columns is not None:
+        # full rows fill the cache; the fieldset only trims the response
+        return FastJSONResponse({**page, "items": [{name: getattr(item, name) for name in columns} for item in page["items"]]})
+    if settings.fast_responses:
+        return FastJSONResponse({**page, "items": [dict(item) for item in page["items"]]})
+    return page
+
+async def fields_response(db: Database, request: Request, model, row_id: int, fields: str, not_found: str):
+    # One item with a sparse fieldset: projected from the cached Read model
+    # when there is one, otherwise a SELECT of just those columns
+    columns = parse_fields(model, fields)
+    item = cache_for(model).get(row_id)
+    if item is not MISSING:
+        row = dict(item)
+    else:
+        row = await db.run_sync(crud.get_columns, model, row_id, columns)
+        if row is None:
+            raise HTTPException(status_code=404, detail=not_found)
+    etag = row_etag(model, row_id, row["version"])
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return FastJSONResponse({name: row[name] for name in columns}, headers={"ETag": etag})
+
+def item_response(item: BaseModel, response: Response, etag: str):
+    # The item is a Read model validated when it entered the cache
+    if settings.fast_responses:
+        return FastJSONResponse(dict(item), headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return item
+
+class BulkCreateResult(BaseModel):
+    ids: List[int]
+
+class UpsertResult(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+
+def ndjson_response(statement, label: str):
+    return StreamingResponse(crud.export_ndjson(statement, label), media_type="application/x-ndjson")
+
+@router.get('/')
 async def root():
     return {'message':'Welcome'}
 
 
-@app.post("/plants/", response_model=PlantRead)
-def create_plant(plant: PlantCreate, db: Session = Depends(get_db)):
-    new_plant = Plants(**plant.dict())
-    db.add(new_plant)
-    db.commit()
-    db.refresh(new_plant)
-    return new_plant
-
-@app.get("/plants/", response_model=List[PlantRead])
-def get_plants(db: Session = Depends(get_db)):
-    return db.query(Plants).all()
-
-@app.get("/plants/{plant_id}", response_model=PlantRead)
-def get_plant(plant_id: int, db: Session = Depends(get_db)):
-    plant = db.query(Plants).get(plant_id)
+@router.post("/plants/", response_model=PlantRead)
+async def create_plant(plant: PlantCreate, db: Database = Depends(get_db)):
+    return await create_response(db, Plants, plant)
+
+@router.post("/plants/bulk", response_model=BulkCreateResult)
+async def create_plants_bulk(plants: List[PlantCreate], db: Database = Depends(get_db)):
+    return await db.run_sync(crud.bulk_insert, Plants, plants)
+
+@router.post("/plants/upsert", response_model=UpsertResult)
+async def upsert_plants(plants: List[PlantCreate], db: Database = Depends(get_db)):
+    result = await db.run_sync(crud.bulk_upsert, Plants, plants)
+    cache_for(Plants).clear()
+    return result
+
+@router.get("/plants/", response_model=PlantPage)
+async def get_plants(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    stream: bool = False,
+    ids: Optional[str] = Query(None, description="comma separated ids; other list parameters are ignored"),
+    fields: Optional[str] = Query(None, description="comma separated columns to return"),
+    db: Database = Depends(get_db),
+):
+    if ids is not None:
+        return await ids_response(db, Plants, PlantRead, ids, fields)
+    listing = crud.Listing(after=None if after is None else (None, after))
+    return await list_response(db, request, response, Plants, PlantRead, limit, listing, stream, fields)
+
+@router.get("/plants/{plant_id}", response_model=PlantRead)
+async def get_plant(
+    plant_id: int, request: Request, response: Response,
+    fields: Optional[str] = Query(None, description="comma separated columns to return"),
+    db: Database = Depends(get_db),
+):
+    if fields is not None:
+        return await fields_response(db, request, Plants, plant_id, fields, "Plant not found")
+    plant = await cached_get(db, Plants, PlantRead, plant_id)
     if not plant:
         raise HTTPException(status_code=404, detail="Plant not found")
-    return plant
-
-@app.put("/plants/{plant_id}", response_model=PlantRead)
-def update_plant(plant_id: int, plant_update: PlantUpdate, db: Session = Depends(get_db)):
-    plant = db.query(Plants).get(plant_id)
+    etag = row_etag(Plants, plant_id, plant.version)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return item_response(plant, response, etag)
+
+@router.put("/plants/{plant_id}", response_model=PlantRead)
+async def update_plant(
+    plant_id: int, plant_update: PlantUpdate, request: Request, response: Response, db: Database = Depends(get_db),
+):
+    plant = await db.run_sync(crud.update_row, Plants, plant_id, plant_update, if_match_version(request, Plants, plant_id))
+    cache_for(Plants).invalidate(plant_id)
     if not plant:
         raise HTTPException(status_code=404, detail="Plant not found")
-    for key, value in plant_update.dict(exclude_unset=True).items():
-        setattr(plant, key, value)
-    db.commit()
-    db.refresh(plant)
+    response.headers["ETag"] = row_etag(Plants, plant_id, plant["version"])
     return plant
 
-@app.delete("/plants/{plant_id}")
-def delete_plant(plant_id: int, db: Session = Depends(get_db)):
-    plant = db.query(Plants).get(plant_id)
-    if not plant:
+@router.delete("/plants/{plant_id}")
+async def delete_plant(plant_id: int, request: Request, db: Database = Depends(get_db)):
+    if not await db.run_sync(crud.delete_row, Plants, plant_id, if_match_version(request, Plants, plant_id)):
         raise HTTPException(status_code=404, detail="Plant not found")
-    db.delete(plant)
-    db.commit()
+    cache_for(Plants).invalidate(plant_id)
     return {"detail": "Plant deleted successfully"}
 
 class ProductBase(BaseModel):
@@ -92,54 +372,91 @@ class ProductCreate(ProductBase):
 
 class ProductRead(ProductBase):
     id: int
+    version: int
 
     class Config:
         from_attributes = True
 
+class ProductPage(BaseModel):
+    items: List[ProductRead]
+    next_cursor: Optional[Union[int, str]] = None
+    missing: Optional[List[int]] = None
+
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     category: Optional[str] = None
     price: Optional[float] = None
 
-@app.post("/products/", response_model=ProductRead)
-def create_product(product: ProductCreate, db: Session = Depends(get_db)):
-    new_product = Products(**product.dict())
-    db.add(new_product)
-    db.commit()
-    db.refresh(new_product)
-    return new_product
-
-@app.get("/products/", response_model=List[ProductRead])
-def get_products(db: Session = Depends(get_db)):
-    return db.query(Products).all()
-
-@app.get("/products/{product_id}", response_model=ProductRead)
-def get_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Products).get(product_id)
+@router.post("/products/", response_model=ProductRead)
+async def create_product(product: ProductCreate, db: Database = Depends(get_db)):
+    return await create_response(db, Products, product)
+
+@router.post("/products/bulk", response_model=BulkCreateResult)
+async def create_products_bulk(products: List[ProductCreate], db: Database = Depends(get_db)):
+    return await db.run_sync(crud.bulk_insert, Products, products)
+
+@router.post("/products/upsert", response_model=UpsertResult)
+async def upsert_products(products: List[ProductCreate], db: Database = Depends(get_db)):
+    result = await db.run_sync(crud.bulk_upsert, Products, products)
+    cache_for(Products).clear()
+    return result
+
+@router.get("/products/", response_model=ProductPage)
+async def get_products(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    category: Optional[List[str]] = Query(None),
+    price_min: Optional[float] = Query(None, ge=0),
+    price_max: Optional[float] = Query(None, ge=0),
+    sort: Optional[str] = Query(None, pattern=r"^-?(id|name|category|price)$"),
+    ids: Optional[str] = Query(None, description="comma separated ids; other list parameters are ignored"),
+    fields: Optional[str] = Query(None, description="comma separated columns to return"),
+    db: Database = Depends(get_db),
+):
+    if ids is not None:
+        return await ids_response(db, Products, ProductRead, ids, fields)
+    if price_min is not None and price_max is not None and price_min > price_max:
+        raise HTTPException(status_code=400, detail="price_min is greater than price_max")
+    conditions = crud.product_filters(split_values(category), price_min, price_max)
+    listing = make_listing(Products, conditions, sort, after)
+    return await list_response(db, request, response, Products, ProductRead, limit, listing, stream, fields)
+
+@router.get("/products/{product_id}", response_model=ProductRead)
+async def get_product(
+    product_id: int, request: Request, response: Response,
+    fields: Optional[str] = Query(None, description="comma separated columns to return"),
+    db: Database = Depends(get_db),
+):
+    if fields is not None:
+        return await fields_response(db, request, Products, product_id, fields, "Product not found")
+    product = await cached_get(db, Products, ProductRead, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    return product
-
-@app.put("/products/{product_id}", response_model=ProductRead)
-def update_product(product_id: int, product_update: ProductUpdate, db: Session = Depends(get_db)):
-    product = db.query(Products).get(product_id)
+    etag = row_etag(Products, product_id, product.version)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return item_response(product, response, etag)
+
+@router.put("/products/{product_id}", response_model=ProductRead)
+async def update_product(
+    product_id: int, product_update: ProductUpdate, request: Request, response: Response, db: Database = Depends(get_db),
+):
+    product = await db.run_sync(crud.update_row, Products, product_id, product_update, if_match_version(request, Products, product_id))
+    cache_for(Products).invalidate(product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
-    for key, value in product_update.dict(exclude_unset=True).items():
-        setattr(product, key, value)
-    db.commit()
-    db.refresh(product)
+    response.headers["ETag"] = row_etag(Products, product_id, product["version"])
     return product
 
-@app.delete("/products/{product_id}")
-def delete_product(product_id: int, db: Session = Depends(get_db)):
-    product = db.query(Products).get(product_id)
-    if not product:
+@router.delete("/products/{product_id}")
+async def delete_product(product_id: int, request: Request, db: Database = Depends(get_db)):
+    if not await db.run_sync(crud.delete_row, Products, product_id, if_match_version(request, Products, product_id)):
         raise HTTPException(status_code=404, detail="Product not found")
-    
-    db.delete(product)
-    db.commit()
+    cache_for(Products).invalidate(product_id)
     return {"detail": "Product deleted successfully"}
 
 class MaterialBase(BaseModel):
@@ -153,53 +470,84 @@ class MaterialCreate(MaterialBase):
 
 class MaterialRead(MaterialBase):
     id: int
+    version: int
 
     class Config:
         from_attributes = True
 
+class MaterialPage(BaseModel):
+    items: List[MaterialRead]
+    next_cursor: Optional[int] = None
+    missing: Optional[List[int]] = None
+
 class MaterialUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     unit: Optional[str] = None
     cost: Optional[float] = None
 
-@app.post("/materials/", response_model=MaterialRead)
-def create_material(material: MaterialCreate, db: Session = Depends(get_db)):
-    new_material = Materials(**material.dict())
-    db.add(new_material)
-    db.commit()
-    db.refresh(new_material)
-    return new_material
-
-@app.get("/materials/", response_model=List[MaterialRead])
-def get_materials(db: Session = Depends(get_db)):
-    return db.query(Materials).all()
-
-@app.get("/materials/{material_id}", response_model=MaterialRead)
-def get_material(material_id: int, db: Session = Depends(get_db)):
-    material = db.query(Materials).get(material_id)
+@router.post("/materials/", response_model=MaterialRead)
+async def create_material(material: MaterialCreate, db: Database = Depends(get_db)):
+    return await create_response(db, Materials, material)
+
+@router.post("/materials/bulk", response_model=BulkCreateResult)
+async def create_materials_bulk(materials: List[MaterialCreate], db: Database = Depends(get_db)):
+    return await db.run_sync(crud.bulk_insert, Materials, materials)
+
+@router.post("/materials/upsert", response_model=UpsertResult)
+async def upsert_materials(materials: List[MaterialCreate], db: Database = Depends(get_db)):
+    result = await db.run_sync(crud.bulk_upsert, Materials, materials)
+    cache_for(Materials).clear()
+    return result
+
+@router.get("/materials/", response_model=MaterialPage)
+async def get_materials(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    stream: bool = False,
+    ids: Optional[str] = Query(None, description="comma separated ids; other list parameters are ignored"),
+    fields: Optional[str] = Query(None, description="comma separated columns to return"),
+    db: Database = Depends(get_db),
+):
+    if ids is not None:
+        return await ids_response(db, Materials, MaterialRead, ids, fields)
+    listing = crud.Listing(after=None if after is None else (None, after))
+    return await list_response(db, request, response, Materials, MaterialRead, limit, listing, stream, fields)
+
+@router.get("/materials/{material_id}", response_model=MaterialRead)
+async def get_material(
+    material_id: int, request: Request, response: Response,
+    fields: Optional[str] = Query(None, description="comma separated columns to return"),
+    db: Database = Depends(get_db),
+):
+    if fields is not None:
+        return await fields_response(db, request, Materials, material_id, fields, "Material not found")
+    material = await cached_get(db, Materials, MaterialRead, material_id)
     if not material:
         raise HTTPException(status_code=404, detail="Material not found")
-    return material
-
-@app.put("/materials/{material_id}", response_model=MaterialRead)
-def update_material(material_id: int, material_update: MaterialUpdate, db: Session = Depends(get_db)):
-    material = db.query(Materials).get(material_id)
+    etag = row_etag(Materials, material_id, material.version)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return item_response(material, response, etag)
+
+@router.put("/materials/{material_id}", response_model=MaterialRead)
+async def update_material(
+    material_id: int, material_update: MaterialUpdate, request: Request, response: Response, db: Database = Depends(get_db),
+):
+    material = await db.run_sync(crud.update_row, Materials, material_id, material_update, if_match_version(request, Materials, material_id))
+    cache_for(Materials).invalidate(material_id)
     if not material:
         raise HTTPException(status_code=404, detail="Material not found")
-    for key, value in material_update.dict(exclude_unset=True).items():
-        setattr(material, key, value)
-    db.commit()
-    db.refresh(material)
+    response.headers["ETag"] = row_etag(Materials, material_id, material["version"])
     return material
 
-@app.delete("/materials/{material_id}")
-def delete_material(material_id: int, db: Session = Depends(get_db)):
-    material = db.query(Materials).get(material_id)
-    if not material:
+@router.delete("/materials/{material_id}")
+async def delete_material(material_id: int, request: Request, db: Database = Depends(get_db)):
+    if not await db.run_sync(crud.delete_row, Materials, material_id, if_match_version(request, Materials, material_id)):
         raise HTTPException(status_code=404, detail="Material not found")
-    db.delete(material)
-    db.commit()
+    cache_for(Materials).invalidate(material_id)
     return {"detail": "Material deleted successfully"}
 
 class OrderBase(BaseModel):
@@ -212,50 +560,318 @@ class OrderCreate(OrderBase):
 
 class OrderRead(OrderBase):
     id: int
+    version: int
 
     class Config:
         from_attributes = True
 
+class OrderPage(BaseModel):
+    items: List[OrderRead]
+    next_cursor: Optional[Union[int, str]] = None
+    missing: Optional[List[int]] = None
+
 class OrderUpdate(BaseModel):
     order_date: Optional[datetime] = None
     customer_name: Optional[str] = None
     status: Optional[str] = None
 
-@app.post("/orders/", response_model=OrderRead)
-def create_order(order: OrderCreate, db: Session = Depends(get_db)):
-    new_order = Orders(**order.dict())
-    db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
-    return new_order
-
-@app.get("/orders/", response_model=List[OrderRead])
-def get_orders(db: Session = Depends(get_db)):
-    return db.query(Orders).all()
-
-@app.get("/orders/{order_id}", response_model=OrderRead)
-def get_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(Orders).get(order_id)
+class OrderLineRead(BaseModel):
+    id: int
+    product_id: Optional[int] = None
+    product_name: Optional[str] = None
+    unit_price: Optional[float] = None
+    quantity: Optional[int] = None
+    line_total: float
+
+class OrderFullRead(OrderRead):
+    lines: List[OrderLineRead]
+    total: float
+
+@router.post("/orders/", response_model=OrderRead)
+async def create_order(order: OrderCreate, db: Database = Depends(get_db)):
+    return await create_response(db, Orders, order)
+
+@router.post("/orders/bulk", response_model=BulkCreateResult)
+async def create_orders_bulk(orders: List[OrderCreate], db: Database = Depends(get_db)):
+    return await db.run_sync(crud.bulk_insert, Orders, orders)
+
+class OrderPlaceLine(BaseModel):
+    product_id: int
+    quantity: int = Field(..., gt=0)
+
+class OrderPlace(BaseModel):
+    order_date: datetime = Field(default_factory=datetime.now)
+    customer_name: str
+    status: str = "Pending"
+    lines: List[OrderPlaceLine] = Field(..., min_length=1, max_length=MAX_ORDER_LINES)
+
+@router.post("/orders/place", response_model=OrderFullRead, status_code=201)
+async def place_order(order: OrderPlace, db: Database = Depends(get_db)):
+    order_id = await db.run_sync(crud.place_order, order)
+    return await db.run_sync(crud.order_detail, order_id)
+
+@router.get("/orders/", response_model=OrderPage)
+async def get_orders(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    status: Optional[List[str]] = Query(None),
+    customer_name: Optional[str] = Query(None, min_length=1),
+    order_date_from: Optional[datetime] = None,
+    order_date_to: Optional[datetime] = None,
+    sort: Optional[str] = Query(None, pattern=r"^-?(id|order_date|customer_name|status)$"),
+    ids: Optional[str] = Query(None, description="comma separated ids; other list parameters are ignored"),
+    fields: Optional[str] = Query(None, description="comma separated columns to return"),
+    db: Database = Depends(get_db),
+):
+    if ids is not None:
+        return await ids_response(db, Orders, OrderRead, ids, fields)
+    if order_date_from is not None and order_date_to is not None and order_date_from > order_date_to:
+        raise HTTPException(status_code=400, detail="order_date_from is after order_date_to")
+    conditions = crud.order_filters(split_values(status), customer_name, order_date_from, order_date_to)
+    listing = make_listing(Orders, conditions, sort, after)
+    return await list_response(db, request, response, Orders, OrderRead, limit, listing, stream, fields)
+
+@router.get("/orders/export")
+def export_orders():
+    statement = select(*Orders.__table__.c).order_by(Orders.id)
+    return ndjson_response(statement, "Orders")
+
+@router.get("/orders/{order_id}/lines/export")
+async def export_order_lines(order_id: int, db: Database = Depends(get_db)):
+    if not await db.run_sync(crud.get_row, Orders, order_id):
+        raise HTTPException(status_code=404, detail="Order not found")
+    statement = (
+        select(*OrdersProducts.__table__.c)
+        .where(OrdersProducts.order_id == order_id)
+        .order_by(OrdersProducts.id)
+    )
+    return ndjson_response(statement, "OrdersProducts")
+
+@router.get("/orders/{order_id}/full", response_model=OrderFullRead)
+async def get_order_full(order_id: int, db: Database = Depends(get_db)):
+    order = await db.run_sync(crud.order_detail, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
-@app.put("/orders/{order_id}", response_model=OrderRead)
-def update_order(order_id: int, order_update: OrderUpdate, db: Session = Depends(get_db)):
-    order = db.query(Orders).get(order_id)
+@router.get("/orders/{order_id}", response_model=OrderRead)
+async def get_order(
+    order_id: int, request: Request, response: Response,
+    fields: Optional[str] = Query(None, description="comma separated columns to return"),
+    db: Database = Depends(get_db),
+):
+    if fields is not None:
+        return await fields_response(db, request, Orders, order_id, fields, "Order not found")
+    order = await cached_get(db, Orders, OrderRead, order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    for key, value in order_update.dict(exclude_unset=True).items():
-        setattr(order, key, value)
-    db.commit()
-    db.refresh(order)
+    etag = row_etag(Orders, order_id, order.version)
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return item_response(order, response, etag)
+
+@router.put("/orders/{order_id}", response_model=OrderRead)
+async def update_order(
+    order_id: int, order_update: OrderUpdate, request: Request, response: Response, db: Database = Depends(get_db),
+):
+    order = await db.run_sync(crud.update_row, Orders, order_id, order_update, if_match_version(request, Orders, order_id))
+    cache_for(Orders).invalidate(order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    response.headers["ETag"] = row_etag(Orders, order_id, order["version"])
     return order
 
-@app.delete("/orders/{order_id}")
-def delete_order(order_id: int, db: Session = Depends(get_db)):
-    order = db.query(Orders).get(order_id)
-    if not order:
+@router.delete("/orders/{order_id}")
+async def delete_order(order_id: int, request: Request, db: Database = Depends(get_db)):
+    if not await db.run_sync(crud.delete_row, Orders, order_id, if_match_version(request, Orders, order_id)):
         raise HTTPException(status_code=404, detail="Order not found")
-    db.delete(order)
-    db.commit()
+    cache_for(Orders).invalidate(order_id)
     return {"detail": "Order deleted successfully"}
+
+class MrpRequest(BaseModel):
+    order_ids: Optional[List[int]] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    include_cancelled: bool = False
+    only_shortfalls: bool = False
+
+class MaterialRequirement(BaseModel):
+    material_id: int
+    name: Optional[str] = None
+    unit: Optional[str] = None
+    required: float
+    in_stock: float
+    shortfall: float
+
+@router.post("/planning/mrp", response_model=List[MaterialRequirement])
+async def plan_material_requirements(request: MrpRequest, db: Database = Depends(get_db)):
+    return await db.run_sync(planning.material_requirements, **request.model_dump())
+
+class ScheduleRequest(BaseModel):
+    order_ids: Optional[List[int]] = None
+    statuses: List[str] = ["Pending"]
+    start: Optional[datetime] = None
+    bucket_hours: int = Field(24, ge=1, le=24 * 31)
+    horizon: int = Field(60, ge=1, le=3660)
+    lead_time_days: float = Field(7, ge=0)
+
+    @field_validator("start")
+    @classmethod
+    def naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # Order dates are stored as naive UTC; an aware start is converted
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+class ScheduleAssignment(BaseModel):
+    order_id: int
+    line_id: int
+    product_id: int
+    plant_id: int
+    bucket: int
+    bucket_start: datetime
+    quantity: float
+
+class ScheduledOrder(BaseModel):
+    order_id: int
+    due: datetime
+    completion: Optional[datetime] = None
+    lateness_days: Optional[float] = None
+
+class UnscheduledLine(BaseModel):
+    order_id: int
+    line_id: int
+    product_id: int
+    quantity: float
+    reason: str
+
+class Schedule(BaseModel):
+    start: Optional[datetime] = None
+    bucket_hours: int
+    assignments: List[ScheduleAssignment]
+    orders: List[ScheduledOrder]
+    unscheduled: List[UnscheduledLine]
+
+@router.post("/planning/schedule", response_model=Schedule)
+async def plan_production_schedule(request: ScheduleRequest, db: Database = Depends(get_db)):
+    return await db.run_sync(planning.schedule_production, **request.model_dump())
+
+class RevenueRow(BaseModel):
+    product_id: Optional[int] = None
+    product_name: Optional[str] = None
+    category: Optional[str] = None
+    customer_name: Optional[str] = None
+    month: Optional[str] = None
+    quantity: int
+    revenue: float
+    order_count: int
+
+@router.get("/reports/revenue", response_model=List[RevenueRow], response_model_exclude_unset=True)
+async def get_revenue_report(
+    group_by: List[str] = Query(["product"]),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    exclude_cancelled: bool = True,
+    db: Database = Depends(get_db),
+):
+    dimensions = split_values(group_by) or []
+    unknown = set(dimensions) - set(reports.DIMENSIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by: {', '.join(sorted(unknown))}")
+    if date_from is not None and date_to is not None and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from is after date_to")
+    return await db.run_sync(reports.revenue, dimensions, date_from, date_to, exclude_cancelled)
+
+class SearchResult(BaseModel):
+    kind: str
+    id: int
+    name: str
+    description: Optional[str] = None
+    score: float
+
+class SearchPage(BaseModel):
+    items: List[SearchResult]
+    next_offset: Optional[int] = None
+
+@router.get("/search", response_model=SearchPage)
+async def search_catalog(
+    q: str = Query(..., min_length=1, max_length=200),
+    kind: Optional[List[str]] = Query(None),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=10_000),
+    db: Database = Depends(get_db),
+):
+    kinds = split_values(kind)
+    unknown = set(kinds or ()) - set(search.KINDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown kind: {', '.join(sorted(unknown))}")
+    return await db.run_sync(search.search, q, kinds, limit, offset)
+
+class ChangeRead(BaseModel):
+    seq: int
+    entity: str
+    row_id: int
+    op: str
+    version: Optional[int] = None
+    changed_at: datetime
+
+class ChangePage(BaseModel):
+    changes: List[ChangeRead]
+    next_since: int
+
+@router.get("/changes", response_model=ChangePage)
+async def get_changes(
+    since: int = Query(0, ge=0, description="seq of the last change already applied"),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    wait: float = Query(0, ge=0, le=settings.changes_max_wait, description="seconds to wait for a change"),
+    db: Database = Depends(get_db),
+):
+    # Long-poll: with wait > 0 an empty answer is held back until a change is
+    # committed or the wait is over
+    deadline = time.monotonic() + wait
+    with changes.notifier.listening() as wake:
+        while True:
+            wake.clear()
+            page = await db.run_sync(changes.read_changes, since, limit)
+            remaining = deadline - time.monotonic()
+            if page["changes"] or remaining <= 0:
+                return page
+            try:
+                await asyncio.wait_for(wake.wait(), min(remaining, settings.changes_poll_interval))
+            except asyncio.TimeoutError:
+                pass
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return {entity: cache.stats() for entity, cache in caches.items()}
+
+@router.get("/group-commit/stats")
+async def get_group_commit_stats():
+    return {
+        "enabled": settings.group_commit,
+        "window_ms": settings.group_commit_window_ms,
+        "max_rows": settings.group_commit_max_rows,
+        **{entity: committer.stats() for entity, committer in group_committers.items()},
+    }
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Reported from the engine that serves the requests in this mode
+    if settings.db_mode == "async":
+        report = await async_engine_report(get_async_engine())
+    else:
+        report = await run_in_threadpool(engine_report, get_engine())
+    server_logger.info("Database mode %s, settings applied: %s", settings.db_mode, report)
+    yield
+
+def create_app() -> FastAPI:
+    # Building the app does not touch the database; the schema and seed data
+    # are created explicitly with `python manage.py init-db`.
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(router)
+    return app
+
+app = create_app()
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from fastapi import HTTPException
+
+from config import settings
+
+# Group commit for the single-row create routes. Instead of one transaction
+# (and one fsync) per request, concurrent inserts into the same table are
+# queued and written together: the first row of a batch waits at most
+# GROUP_COMMIT_WINDOW_MS for others, a batch holds at most
+# GROUP_COMMIT_MAX_ROWS. Each caller still gets its own row, or its own 409
+# when its row was rejected.
+
+# Upper bounds of the batch size histogram
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class GroupCommitter:
+    def __init__(self, write: Callable[[List[dict]], Awaitable[list]], window_ms: float, max_rows: int):
+        # write(rows) runs one transaction and returns a row dict or an exception per row
+        self.write = write
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self._loop = None
+        self._queue = None
+        self._task = None
+        self.batches = self.rows = self.rejected = self.failed_batches = 0
+        self.largest = 0
+        self.histogram = dict.fromkeys(BATCH_SIZE_BUCKETS, 0)
+        self.write_seconds = 0.0
+
+    async def submit(self, row: dict) -> dict:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # the queue and the writer task belong to one event loop
+            self._loop, self._queue = loop, asyncio.Queue()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        future = loop.create_future()
+        await self._queue.put((row, future))
+        result = await future
+        if isinstance(result, Exception):
+            raise HTTPException(status_code=409, detail=f"Insert rejected: {getattr(result, 'orig', result)}")
+        return result
+
+    async def _run(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            results = await self.write([row for row, _ in batch])
+        except Exception as e:
+            self.failed_batches += 1
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.write_seconds += time.perf_counter() - started
+        self._record(len(batch), sum(isinstance(result, Exception) for result in results))
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, size: int, rejected: int):
+        self.batches += 1
+        self.rows += size
+        self.rejected += rejected
+        self.largest = max(self.largest, size)
+        bucket = next((bound for bound in BATCH_SIZE_BUCKETS if size <= bound), BATCH_SIZE_BUCKETS[-1])
+        self.histogram[bucket] += 1
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "rows": self.rows,
+            "rejected": self.rejected,
+            "failed_batches": self.failed_batches,
+            "mean_batch_size": self.rows / self.batches if self.batches else 0,
+            "largest_batch": self.largest,
+            # batch count per size range, keyed by the upper bound of the range
+            "batch_sizes": {f"<={bound}": count for bound, count in self.histogram.items()},
+            "mean_write_ms": self.write_seconds / (self.batches + self.failed_batches) * 1000
+            if self.batches + self.failed_batches else 0,
+        }
+
+
+def make_group_committers(models, write) -> Dict[str, GroupCommitter]:
+    # write(model, rows) -> awaitable list of results
+    def writer(model):
+        return lambda rows: write(model, rows)
+
+    return {
+        model.__tablename__.lower(): GroupCommitter(
+            writer(model), settings.group_commit_window_ms, settings.group_commit_max_rows
+        )
+        for model in models
+    }
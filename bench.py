@@ -0,0 +1,349 @@
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmarks run against a throw-away database, never against project.db.
+# Each scenario runs in a subprocess per configuration because the database
+# settings are read when the modules are imported.
+#
+#   python bench.py latency --requests 5000 --concurrency 200
+#   python bench.py coldstart --max-ms 1500    (exits non-zero above the limit)
+#   python bench.py serialization --rows 5000 --requests 50
+#   python bench.py creates --requests 5000 --concurrency 200
+#   python bench.py creates --entity plants --duplicates 500   (exits non-zero on a lost or misrouted row)
+#   python bench.py writes --requests 2000
+#   python bench.py place --requests 5000 --concurrency 200   (exits non-zero on oversell)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def fire(client, paths, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(path):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get(path)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(path) for path in paths))
+    return latencies, time.perf_counter() - started
+
+
+async def latency_worker(args):
+    import httpx
+    import api
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        products = [{"name": f"Bench product {i}", "category": "Bench", "price": i % 100 + 0.99} for i in range(args.rows)]
+        (await client.post("/products/bulk", json=products)).raise_for_status()
+        paths = [
+            f"/products/{i % args.rows + 1}" if i % 4 else "/products/?limit=50"
+            for i in range(args.requests)
+        ]
+        latencies, elapsed = await fire(client, paths, args.concurrency)
+    return {
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "req_per_s": len(latencies) / elapsed,
+    }
+
+
+async def coldstart_worker(args):
+    # Import-to-first-request time: importing the API must not create tables,
+    # seed data or open connections before the first request needs one.
+    started = time.perf_counter()
+    import httpx
+    import api
+    imported = time.perf_counter()
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        (await client.get("/plants/1")).raise_for_status()
+    finished = time.perf_counter()
+    return {
+        "import_ms": (imported - started) * 1000,
+        "first_request_ms": (finished - started) * 1000,
+    }
+
+
+def sample_payloads(entity, count):
+    if entity == "plants":
+        return [{"name": f"Bench plant {i}", "location": "Bench City", "capacity": i} for i in range(count)]
+    if entity == "products":
+        return [
+            {"name": f"Bench product {i}", "description": "A product used by the benchmarks. " * 4,
+             "category": "Bench", "price": i % 100 + 0.99}
+            for i in range(count)
+        ]
+    if entity == "materials":
+        return [{"name": f"Bench material {i}", "description": "Bench material", "unit": "kg", "cost": 1.5} for i in range(count)]
+    return [{"order_date": "2024-01-01T10:00:00", "customer_name": f"Customer {i}", "status": "Pending"} for i in range(count)]
+
+
+async def serialization_worker(args):
+    # Mean time per request of a full page (limit=1000) and of a cached item,
+    # per endpoint; run once with and once without FAST_RESPONSES
+    import httpx
+    import api
+
+    results = {}
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for entity in ("plants", "products", "materials", "orders"):
+            (await client.post(f"/{entity}/bulk", json=sample_payloads(entity, args.rows))).raise_for_status()
+            for label, path in (("list", f"/{entity}/?limit=1000"), ("item", f"/{entity}/1")):
+                (await client.get(path)).raise_for_status()  # warm up the cache
+                started = time.perf_counter()
+                for _ in range(args.requests):
+                    (await client.get(path)).raise_for_status()
+                results[f"{entity}_{label}_ms"] = (time.perf_counter() - started) / args.requests * 1000
+    return results
+
+
+async def creates_worker(args):
+    # Concurrent single-row creates, one commit per request or grouped. With
+    # --duplicates, that many requests repeat the unique name of another one:
+    # exactly one of each name may be created, the others get a 409, and
+    # every created row must be the one its caller sent.
+    import random
+    import httpx
+    import api
+
+    key = "customer_name" if args.entity == "orders" else "name"
+    payloads = sample_payloads(args.entity, args.requests - args.duplicates)
+    payloads += [dict(payloads[i % len(payloads)]) for i in range(args.duplicates)]
+    random.Random(args.requests).shuffle(payloads)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+        created, statuses = [], {}
+
+        async def create(payload):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post(f"/{args.entity}/", json=payload)
+                latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                created.append((payload, response.json()))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(create(payload) for payload in payloads))
+        elapsed = time.perf_counter() - started
+        batches = (await client.get("/group-commit/stats")).json()[args.entity]
+        stored = {}
+        for _, row in created:
+            response = await client.get(f"/{args.entity}/{row['id']}")
+            stored[row["id"]] = response.json()[key] if response.status_code == 200 else None
+    names = [payload[key] for payload, _ in created]
+    return {
+        "req_per_s": args.requests / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_batch_size": batches["mean_batch_size"],
+        "created": statuses.get(200, 0),
+        "rejected": statuses.get(409, 0),
+        "errors": args.requests - statuses.get(200, 0) - statuses.get(409, 0),
+        # rows handed to a caller that sent something else, or to two callers
+        "wrong_rows": sum(1 for payload, row in created if row[key] != payload[key] or stored[row["id"]] != payload[key])
+        + len(created) - len({row["id"] for _, row in created}),
+        # names created twice (when unique) or never
+        "lost_or_doubled": (len(names) - len(set(names)) if key == "name" else 0)
+        + len({payload[key] for payload in payloads} - set(names)),
+    }
+
+
+async def writes_worker(args):
+    # Sequential single-row create, update and delete: mean latency and SQL
+    # statements per request (BEGIN/COMMIT not included)
+    import httpx
+    from sqlalchemy import event
+    import api
+    from sql import get_engine
+
+    statements = [0]
+    event.listen(get_engine(), "before_cursor_execute", lambda *args: statements.__setitem__(0, statements[0] + 1))
+    results = {}
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        payloads = sample_payloads("products", args.requests)
+        ids = []
+        for label, send in (
+            ("create", lambda i: client.post("/products/", json=payloads[i])),
+            ("update", lambda i: client.put(f"/products/{ids[i]}", json={"price": i % 50 + 0.5})),
+            ("delete", lambda i: client.delete(f"/products/{ids[i]}")),
+        ):
+            statements[0] = 0
+            started = time.perf_counter()
+            for i in range(args.requests):
+                response = await send(i)
+                response.raise_for_status()
+                if label == "create":
+                    ids.append(response.json()["id"])
+            results[f"{label}_ms"] = (time.perf_counter() - started) / args.requests * 1000
+            results[f"{label}_statements"] = statements[0] / args.requests
+    return results
+
+
+async def place_worker(args):
+    # Concurrent POST /orders/place against a small stock: every product must
+    # end with stock >= 0 and exactly its initial stock minus what was sold
+    import random
+    import httpx
+    from sqlalchemy import insert, select
+    import api
+    from sql import OrdersProducts, StorageProducts, get_engine
+
+    products, stock = 20, args.stock
+    random.seed(args.requests)
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        payloads = [{"name": f"Stock product {i}", "category": "Bench", "price": 1.0} for i in range(products)]
+        ids = (await client.post("/products/bulk", json=payloads)).json()["ids"]
+        with get_engine().begin() as connection:
+            connection.execute(insert(StorageProducts), [{"product_id": i, "quantity": stock} for i in ids])
+        semaphore = asyncio.Semaphore(args.concurrency)
+        statuses = {}
+
+        async def place(n):
+            lines = [{"product_id": random.choice(ids), "quantity": random.randint(1, 3)} for _ in range(random.randint(1, 3))]
+            async with semaphore:
+                response = await client.post("/orders/place", json={"customer_name": f"Bench {n}", "lines": lines})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(place(n) for n in range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    with get_engine().connect() as connection:
+        left = dict(connection.execute(select(StorageProducts.product_id, StorageProducts.quantity)
+                                       .where(StorageProducts.product_id.in_(ids))).all())
+        sold = dict.fromkeys(ids, 0)
+        for product_id, quantity in connection.execute(select(OrdersProducts.product_id, OrdersProducts.quantity)
+                                                       .where(OrdersProducts.product_id.in_(ids))):
+            sold[product_id] += quantity
+    return {
+        "req_per_s": args.requests / elapsed,
+        "placed": statuses.get(201, 0),
+        "rejected": statuses.get(409, 0),
+        "errors": args.requests - statuses.get(201, 0) - statuses.get(409, 0),
+        "oversold": sum(1 for i in ids if left[i] < 0 or left[i] + sold[i] != stock),
+    }
+
+
+WORKERS = {
+    "latency": latency_worker,
+    "coldstart": coldstart_worker,
+    "serialization": serialization_worker,
+    "creates": creates_worker,
+    "writes": writes_worker,
+    "place": place_worker,
+}
+
+# Result checked against --max-ms, per scenario.
+LIMITED_RESULTS = {
+    "coldstart": "first_request_ms",
+}
+
+# Results that must be zero, per scenario.
+ZERO_RESULTS = {
+    "creates": ("errors", "wrong_rows", "lost_or_doubled"),
+    "place": ("errors", "oversold"),
+}
+
+# Configurations compared by each scenario, as environment overrides.
+CONFIGURATIONS = {
+    "latency": {
+        "sync": {"DB_MODE": "sync"},
+        "async": {"DB_MODE": "async"},
+    },
+    "coldstart": {
+        "sync": {"DB_MODE": "sync"},
+        "async": {"DB_MODE": "async"},
+    },
+    "serialization": {
+        "validated": {"FAST_RESPONSES": "0"},
+        "fast": {"FAST_RESPONSES": "1"},
+    },
+    "creates": {
+        "per_request": {"GROUP_COMMIT": "0"},
+        "group_commit": {"GROUP_COMMIT": "1"},
+    },
+    "writes": {
+        "sync": {"DB_MODE": "sync"},
+    },
+    "place": {
+        "sync": {"DB_MODE": "sync"},
+        "async": {"DB_MODE": "async"},
+    },
+}
+
+
+def run_worker(scenario, env_overrides, argv):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL="sqlite:///" + os.path.join(tmp, "bench.db"), DB_ECHO="0", **env_overrides)
+        subprocess.run(
+            [sys.executable, os.path.join(BASE_DIR, "manage.py"), "init-db"],
+            env=env, cwd=BASE_DIR, check=True, capture_output=True,
+        )
+        output = subprocess.run(
+            [sys.executable, os.path.join(BASE_DIR, "bench.py"), "--worker", scenario, *argv],
+            env=env, cwd=BASE_DIR, check=True, capture_output=True, text=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the API")
+    parser.add_argument("scenario", choices=sorted(WORKERS))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--entity", choices=["plants", "products", "materials", "orders"], default="orders",
+                        help="table to create rows in (creates)")
+    parser.add_argument("--duplicates", type=int, default=0, help="requests repeating another one's name (creates)")
+    parser.add_argument("--stock", type=int, default=100, help="initial stock of each product (place)")
+    parser.add_argument("--max-ms", type=float, help="fail when the checked result of the scenario is slower")
+    args, _ = parser.parse_known_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(WORKERS[args.scenario](args))))
+        return
+
+    argv = sys.argv[2:]
+    failed = False
+    for name, env_overrides in CONFIGURATIONS[args.scenario].items():
+        result = run_worker(args.scenario, env_overrides, argv)
+        print(f"{args.scenario:<10} {name:<10} " + "  ".join(f"{key}={value:.2f}" for key, value in result.items()))
+        checked = LIMITED_RESULTS.get(args.scenario)
+        if args.max_ms is not None and checked and result[checked] > args.max_ms:
+            print(f"{args.scenario:<10} {name:<10} {checked} above the {args.max_ms:.0f} ms limit")
+            failed = True
+        for key in ZERO_RESULTS.get(args.scenario, ()):
+            if result[key]:
+                print(f"{args.scenario:<10} {name:<10} {key}={result[key]:.0f}, expected 0")
+                failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable
+
+from config import settings
+
+# In-process read-through cache for the get-by-id routes. Entries are the
+# validated Read models; writes going through the API invalidate them. Other
+# processes are not notified, so the TTL bounds how stale an entry can get
+# when several workers write to the same database.
+#
+# A load that overlaps a write must not store the row it read before the
+# write: callers take generation(key) before loading and pass it to set(),
+# which skips the store when the key was invalidated in between.
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self._generations = {}  # key -> number of invalidations since the last clear()
+        self._epoch = 0  # number of clear() calls
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def generation(self, key: Hashable):
+        with self._lock:
+            return self._epoch, self._generations.get(key, 0)
+
+    def set(self, key: Hashable, value, size: int = 1, generation=None):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != (self._epoch, self._generations.get(key, 0)):
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+            self._generations.clear()
+            self._epoch += 1
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class NullCache:
+    # Stands in for the cache of an entity that has caching switched off
+    def get(self, key):
+        return MISSING
+
+    def generation(self, key):
+        return None
+
+    def set(self, key, value, size: int = 1, generation=None):
+        pass
+
+    def invalidate(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"enabled": False}
+
+
+def make_caches(tables) -> Dict[str, object]:
+    return {
+        table: NullCache() if table in settings.cache_disabled
+        else LRUCache(settings.cache_max_entries, settings.cache_max_bytes, settings.cache_ttl)
+        for table in tables
+    }
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from sql import ChangeLog
+
+# Change-data-capture feed over the ChangeLog table (see changelog_ddl in
+# sql.py). Consumers remember the seq of the last change they applied and ask
+# for the changes after it; the changed rows themselves are fetched with the
+# ids= lookup of the list routes.
+#
+# Long-polling readers wait on a ChangeNotifier, woken when a session that
+# wrote to the database commits in this process. Writes from other processes
+# are picked up by re-reading the log every CHANGES_POLL_INTERVAL seconds.
+
+
+class ChangeNotifier:
+    def __init__(self):
+        # (event loop, asyncio.Event) of every waiting request; commits happen
+        # in worker threads in sync mode, so wake-ups go through the loop
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def listening(self):
+        # Register before reading the log, so that a commit landing between
+        # the read and the wait is not missed
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            yield waiter[1]
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, wake in waiters:
+            loop.call_soon_threadsafe(wake.set)
+
+
+notifier = ChangeNotifier()
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_write(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_commit(session):
+    if session.info.pop("wrote", False):
+        notifier.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_write(session):
+    session.info.pop("wrote", None)
+
+
+def read_changes(db: Session, since: int, limit: int) -> dict:
+    # One primary key range scan; next_since is the seq to ask from next time
+    rows = db.execute(
+        select(ChangeLog.__table__).where(ChangeLog.seq > since).order_by(ChangeLog.seq).limit(limit)
+    ).all()
+    # End the read transaction, so that the next read of a long-poll sees
+    # the commits made in the meantime
+    db.rollback()
+    changes = [dict(row._mapping) for row in rows]
+    return {"changes": changes, "next_since": changes[-1]["seq"] if changes else since}
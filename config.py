@@ -0,0 +1,88 @@
+import os
+from dataclasses import dataclass, field
+from typing import FrozenSet
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_FILE = os.path.join(BASE_DIR, "project.db")
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_set(name: str) -> FrozenSet[str]:
+    return frozenset(item.strip().lower() for item in os.environ.get(name, "").split(",") if item.strip())
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return default if value in (None, "") else int(value)
+
+
+@dataclass(frozen=True)
+class Settings:
+    database_url: str = "sqlite:///" + DATABASE_FILE
+    # "sync" keeps the blocking Session path, "async" serves requests through AsyncSession + aiosqlite
+    db_mode: str = "sync"
+    echo: bool = False
+    # SQLite pragmas applied on every new connection
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    cache_size: int = -64000  # negative values are KiB, i.e. 64 MiB per connection
+    mmap_size: int = 256 * 1024 * 1024
+    busy_timeout: int = 5000  # ms
+    temp_store: str = "MEMORY"
+    # connection pool
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: int = 30
+    # encode trusted rows straight to JSON bytes instead of validating every item
+    fast_responses: bool = False
+    # get-by-id cache, per entity ("plants", "products", "materials", "orders")
+    cache_max_entries: int = 10_000
+    cache_max_bytes: int = 32 * 1024 * 1024
+    cache_ttl: int = 300  # seconds
+    cache_disabled: FrozenSet[str] = field(default_factory=frozenset)
+    # group commit for the single-row create routes: concurrent inserts wait
+    # up to the window (or until max rows) and share one transaction
+    group_commit: bool = False
+    group_commit_window_ms: float = 3.0
+    group_commit_max_rows: int = 100
+    # GET /changes long-poll: longest wait a client may ask for, and how often
+    # a waiting request re-reads the log when no write of this process woke it
+    changes_max_wait: float = 30.0
+    changes_poll_interval: float = 1.0
+
+
+def load_settings() -> Settings:
+    defaults = Settings()
+    return Settings(
+        database_url=os.environ.get("DATABASE_URL", defaults.database_url),
+        db_mode=os.environ.get("DB_MODE", defaults.db_mode),
+        echo=_env_bool("DB_ECHO", defaults.echo),
+        journal_mode=os.environ.get("DB_JOURNAL_MODE", defaults.journal_mode),
+        synchronous=os.environ.get("DB_SYNCHRONOUS", defaults.synchronous),
+        cache_size=_env_int("DB_CACHE_SIZE", defaults.cache_size),
+        mmap_size=_env_int("DB_MMAP_SIZE", defaults.mmap_size),
+        busy_timeout=_env_int("DB_BUSY_TIMEOUT", defaults.busy_timeout),
+        temp_store=os.environ.get("DB_TEMP_STORE", defaults.temp_store),
+        pool_size=_env_int("DB_POOL_SIZE", defaults.pool_size),
+        max_overflow=_env_int("DB_MAX_OVERFLOW", defaults.max_overflow),
+        pool_timeout=_env_int("DB_POOL_TIMEOUT", defaults.pool_timeout),
+        fast_responses=_env_bool("FAST_RESPONSES", defaults.fast_responses),
+        cache_max_entries=_env_int("CACHE_MAX_ENTRIES", defaults.cache_max_entries),
+        cache_max_bytes=_env_int("CACHE_MAX_BYTES", defaults.cache_max_bytes),
+        cache_ttl=_env_int("CACHE_TTL", defaults.cache_ttl),
+        cache_disabled=_env_set("CACHE_DISABLED"),
+        group_commit=_env_bool("GROUP_COMMIT", defaults.group_commit),
+        group_commit_window_ms=float(os.environ.get("GROUP_COMMIT_WINDOW_MS", defaults.group_commit_window_ms)),
+        group_commit_max_rows=_env_int("GROUP_COMMIT_MAX_ROWS", defaults.group_commit_max_rows),
+        changes_max_wait=float(os.environ.get("CHANGES_MAX_WAIT", defaults.changes_max_wait)),
+        changes_poll_interval=float(os.environ.get("CHANGES_POLL_INTERVAL", defaults.changes_poll_interval)),
+    )
+
+
+settings = load_settings()
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# The settings are read when config is imported, so the tests point them at a
+# throw-away database before any module of the API is loaded. project.db is
+# never touched.
+TEST_DIR = tempfile.mkdtemp(prefix="project-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(TEST_DIR, "test.db")
+
+
+@pytest.fixture(scope="session")
+def client():
+    # The API over a freshly created and seeded database
+    from fastapi.testclient import TestClient
+
+    import api
+    from manage import init_db
+    from sql import get_engine
+
+    init_db(get_engine())
+    return TestClient(api.app)
+
+
+@pytest.fixture
+def db(client):
+    # A plain Session on the database of `client`, for the service functions
+    from sqlalchemy.orm import Session
+
+    from sql import get_engine
+
+    with Session(bind=get_engine()) as session:
+        yield session
+
+
+@pytest.fixture
+def empty_db(tmp_path):
+    # A Session on a database of its own with the current schema and no rows
+    from dataclasses import replace
+
+    from sqlalchemy.orm import Session
+
+    from config import settings
+    from migrations import create_or_migrate
+    from sql import make_engine
+
+    engine = make_engine(replace(settings, database_url=f"sqlite:///{tmp_path / 'empty.db'}"))
+    create_or_migrate(engine)
+    with Session(bind=engine) as session:
+        yield session
+    engine.dispose()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
@@ -0,0 +1,533 @@
+import base64
+import binascii
+import json
+import logging
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+from typing import List, Optional, Tuple, Union
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import DateTime, UniqueConstraint, and_, bindparam, delete, insert, or_, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.sql import operators
+
+from responses import render_json
+from sql import Orders, OrdersProducts, Products, StorageProducts, TableVersions, get_engine
+
+# Blocking data-access functions shared by the sync and the async mode of the
+# API: they always receive a plain Session, either directly (sync mode, run in
+# the threadpool) or through AsyncSession.run_sync (async mode).
+
+logger = logging.getLogger(__name__)
+
+# Conservative default of SQLITE_MAX_VARIABLE_NUMBER for older SQLite builds.
+SQLITE_MAX_VARIABLES = 999
+
+EXPORT_CHUNK_SIZE = 5000
+EXPORT_TARGET_ROWS_PER_SEC = 20_000
+
+def bump_version(db: Session, model):
+    # The table triggers move the counters on every row written (see
+    # table_version_ddl in sql.py); an explicit bump is only needed to make a
+    # transaction start with a write
+    statement = sqlite_insert(TableVersions).values(name=model.__tablename__, version=1)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[TableVersions.name],
+        set_={"version": TableVersions.version + 1},
+    ))
+
+def table_version(db: Session, model) -> int:
+    return db.scalar(select(TableVersions.version).where(TableVersions.name == model.__tablename__)) or 0
+
+def get_row(db: Session, model, row_id: int):
+    return db.get(model, row_id)
+
+def get_rows(db: Session, model, ids: List[int]) -> list:
+    # One WHERE id IN (...) per chunk of ids below SQLite's variable limit
+    rows = []
+    for start in range(0, len(ids), SQLITE_MAX_VARIABLES):
+        chunk = ids[start:start + SQLITE_MAX_VARIABLES]
+        rows.extend(db.execute(select(model).where(model.id.in_(chunk))).scalars())
+    return rows
+
+def _returning(model):
+    return model.__table__.c
+
+def create_row(db: Session, model, payload: BaseModel):
+    # One INSERT ... RETURNING gives back the stored row, defaults included,
+    # without the refresh SELECT of an add/flush/refresh cycle
+    try:
+        row = db.execute(insert(model).returning(*_returning(model)), payload.model_dump()).one()
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Insert rejected: {e.orig}")
+    return dict(row._mapping)
+
+def _version_conflict(db: Session, model, row_id: int, expected_version: int):
+    # Only reached when the conditional statement matched no row: tells a
+    # missing row (None) from a stale version (412)
+    current = db.scalar(select(model.version).where(model.id == row_id))
+    db.rollback()
+    if current is not None:
+        raise HTTPException(
+            status_code=412,
+            detail={"message": "Version mismatch", "expected_version": expected_version, "current_version": current},
+        )
+
+def update_row(db: Session, model, row_id: int, payload: BaseModel, expected_version: Optional[int] = None):
+    # One UPDATE ... WHERE id = ? [AND version = ?] RETURNING *; no row back
+    # means no such id, or another writer got there first. Every update
+    # moves the row to the next version.
+    values = payload.model_dump(exclude_unset=True)
+    conditions = [model.id == row_id]
+    if expected_version is not None:
+        conditions.append(model.version == expected_version)
+    if not values:
+        row = db.execute(select(*_returning(model)).where(*conditions)).one_or_none()
+        if row is None and expected_version is not None:
+            _version_conflict(db, model, row_id, expected_version)
+        return None if row is None else dict(row._mapping)
+    statement = (
+        update(model).where(*conditions).values(**values, version=model.version + 1)
+        .returning(*_returning(model))
+        .execution_options(synchronize_session=False)
+    )
+    try:
+        row = db.execute(statement).one_or_none()
+        if row is None:
+            if expected_version is not None:
+                _version_conflict(db, model, row_id, expected_version)
+            db.rollback()
+            return None
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Update rejected: {e.orig}")
+    return dict(row._mapping)
+
+@lru_cache(maxsize=None)
+def referencing_columns(model) -> tuple:
+    # The foreign key columns of other tables that point at model.id
+    return tuple(
+        key.parent for table in model.metadata.sorted_tables for key in table.foreign_keys
+        if key.column.table is model.__table__
+    )
+
+def delete_row(db: Session, model, row_id: int, expected_version: Optional[int] = None) -> bool:
+    # One DELETE ... WHERE id = ? [AND version = ?] RETURNING id, then the
+    # rows referencing it (order lines, stock, bills of materials, ...) are
+    # detached by setting their foreign key to NULL in the same transaction
+    statement = delete(model).where(model.id == row_id)
+    if expected_version is not None:
+        statement = statement.where(model.version == expected_version)
+    statement = statement.returning(model.id).execution_options(synchronize_session=False)
+    if db.execute(statement).scalar_one_or_none() is None:
+        if expected_version is not None:
+            _version_conflict(db, model, row_id, expected_version)
+        db.rollback()
+        return False
+    for column in referencing_columns(model):
+        db.execute(update(column.table).where(column == row_id).values({column.name: None}))
+    db.commit()
+    return True
+
+def order_detail(db: Session, order_id: int):
+    # Two queries whatever the number of lines: the order, then its lines
+    # joined with their products (selectinload + joinedload).
+    order = db.execute(
+        select(Orders)
+        .where(Orders.id == order_id)
+        .options(selectinload(Orders.orders_products).joinedload(OrdersProducts.products))
+    ).scalar_one_or_none()
+    if not order:
+        return None
+    lines = []
+    for line in sorted(order.orders_products, key=lambda line: line.id):
+        product = line.products
+        unit_price = product.price if product and product.price is not None else None
+        line_total = unit_price * (line.quantity or 0) if unit_price is not None else Decimal(0)
+        lines.append({
+            "id": line.id,
+            "product_id": line.product_id,
+            "product_name": product.name if product else None,
+            "unit_price": unit_price,
+            "quantity": line.quantity,
+            "line_total": line_total,
+        })
+    return {
+        "id": order.id,
+        "order_date": order.order_date,
+        "customer_name": order.customer_name,
+        "status": order.status,
+        "version": order.version,
+        "lines": lines,
+        "total": sum((line["line_total"] for line in lines), Decimal(0)),
+    }
+
+# Columns the list routes may sort by; each one must be backed by an index
+# (checked when the module is imported and by `manage.py explain`).
+SORTABLE = {
+    Orders: ("id", "order_date", "customer_name", "status"),
+    Products: ("id", "name", "category", "price"),
+}
+
+def _indexed_columns(model) -> set:
+    table = model.__table__
+    columns = {column.name for column in table.primary_key.columns}
+    for index in table.indexes:
+        columns.add(index.columns[0].name)
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            columns.add(next(iter(constraint.columns)).name)
+    columns.update(column.name for column in table.columns if column.unique)
+    return columns
+
+def _check_sortable():
+    for model, columns in SORTABLE.items():
+        missing = set(columns) - _indexed_columns(model)
+        if missing:
+            raise RuntimeError(f"Sortable columns of {model.__tablename__} without an index: {sorted(missing)}")
+
+_check_sortable()
+
+def _index_column_lists(model) -> list:
+    # Column names of every index of the table, the primary key (rowid) first
+    lists = [[column.name for column in model.__table__.primary_key.columns]]
+    lists.extend([column.name for column in index.columns] for index in model.__table__.indexes)
+    lists.extend(
+        [column.name for column in constraint.columns]
+        for constraint in model.__table__.constraints if isinstance(constraint, UniqueConstraint)
+    )
+    lists.extend([column.name] for column in model.__table__.columns if column.unique)
+    return lists
+
+def index_order_available(model, listing: "Listing") -> bool:
+    # Whether some index yields the filtered rows already in (sort, id) order,
+    # so that a page reads `limit` index entries instead of sorting every
+    # match. That takes an index on exactly the columns compared with "=",
+    # in any order, followed by the sort column (SQLite appends the rowid to
+    # every index). A range or a multi-value IN can only be on the sort
+    # column itself.
+    equal = listing.equal_columns()
+    other = {condition.left.name for condition in listing.conditions} - equal
+    sort = listing.sort
+    if other - {sort}:
+        return False
+    if sort in equal:
+        # one sort value: the order is the id order
+        equal.discard(sort)
+        sort = "id" if not other else sort
+    if sort == "id":
+        return not equal or any(set(columns) == equal for columns in _index_column_lists(model))
+    return any(
+        set(columns[:-1]) == equal and columns[-1] == sort
+        for columns in _index_column_lists(model)
+    )
+
+def index_ordered_sorts(model, conditions) -> list:
+    listing = Listing(list(conditions))
+    return [sort for sort in SORTABLE[model] if index_order_available(model, replace(listing, sort=sort))]
+
+def default_sort(model, conditions) -> str:
+    # The sort of a list request that did not ask for one: id when an index
+    # serves it with these filters, otherwise the first column that can be
+    # read in index order (the column of a range or multi-value filter)
+    sorts = index_ordered_sorts(model, conditions)
+    return "id" if "id" in sorts or not sorts else sorts[0]
+
+def check_index_order(model, listing: "Listing"):
+    if not index_order_available(model, listing):
+        sorts = index_ordered_sorts(model, listing.conditions)
+        detail = f"sort={listing.sort} is not supported with these filters"
+        raise HTTPException(status_code=400, detail=f"{detail}; use sort={' or '.join(sorts)}" if sorts else detail)
+
+def order_filters(status=None, customer_name=None, order_date_from=None, order_date_to=None) -> list:
+    conditions = []
+    if status:
+        conditions.append(Orders.status == status[0] if len(status) == 1 else Orders.status.in_(status))
+    if customer_name is not None:
+        conditions.append(Orders.customer_name == customer_name)
+    if order_date_from is not None:
+        conditions.append(Orders.order_date >= order_date_from)
+    if order_date_to is not None:
+        conditions.append(Orders.order_date < order_date_to)
+    return conditions
+
+def product_filters(category=None, price_min=None, price_max=None) -> list:
+    conditions = []
+    if category:
+        conditions.append(Products.category == category[0] if len(category) == 1 else Products.category.in_(category))
+    if price_min is not None:
+        conditions.append(Products.price >= price_min)
+    if price_max is not None:
+        conditions.append(Products.price <= price_max)
+    return conditions
+
+@dataclass
+class Listing:
+    # What a list route asked for: filters, the sort column and direction, and
+    # the (sort value, id) of the last row already returned
+    conditions: list = field(default_factory=list)
+    sort: str = "id"
+    descending: bool = False
+    after: Optional[Tuple[object, int]] = None
+
+    def statement(self, model, *entities):
+        column = getattr(model, self.sort)
+        statement = select(*entities).where(*self.conditions)
+        if self.after is not None:
+            statement = statement.where(self._after_condition(model, column))
+        if self.sort == "id":
+            return statement.order_by(model.id.desc() if self.descending else model.id)
+        if self.descending:
+            return statement.order_by(column.desc(), model.id.desc())
+        return statement.order_by(column, model.id)
+
+    def _after_condition(self, model, column):
+        # Row-value comparisons such as (order_date, id) > (?, ?) let SQLite
+        # seek the (column, rowid) index directly. SQLite sorts NULLs first,
+        # so nullable columns need the NULL rows handled separately.
+        value, row_id = self.after
+        if self.sort == "id" or self.sort in self.equal_columns():
+            # a sort column fixed by an "=" filter leaves only the id to compare
+            return model.id < row_id if self.descending else model.id > row_id
+        if value is None:
+            if self.descending:
+                return and_(column.is_(None), model.id < row_id)
+            return or_(and_(column.is_(None), model.id > row_id), column.is_not(None))
+        if self.descending:
+            condition = tuple_(column, model.id) < tuple_(value, row_id)
+            return or_(condition, column.is_(None)) if column.nullable else condition
+        return tuple_(column, model.id) > tuple_(value, row_id)
+
+    def equal_columns(self) -> set:
+        return {condition.left.name for condition in self.conditions if condition.operator is operators.eq}
+
+    def next_page(self, rows, limit: int, value_of):
+        # Returns (page rows, raw position after the page or None)
+        if len(rows) <= limit:
+            return rows, None
+        last = rows[limit - 1]
+        return rows[:limit], (value_of(last, self.sort), value_of(last, "id"))
+
+def encode_cursor(sort: str, position) -> Union[int, str, None]:
+    # Plain id for the default order (compatible with the original int cursor),
+    # an opaque token carrying the sort value otherwise
+    if position is None:
+        return None
+    if sort == "id":
+        return position[1]
+    return base64.urlsafe_b64encode(render_json(list(position))).decode().rstrip("=")
+
+def decode_cursor(model, sort: str, cursor: str) -> Tuple[object, int]:
+    # Raises ValueError for a cursor that was not produced by encode_cursor
+    if sort == "id":
+        return None, int(cursor)
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (TypeError, binascii.Error, json.JSONDecodeError) as e:
+        raise ValueError("malformed cursor") from e
+    if value is not None and isinstance(getattr(model, sort).type, DateTime):
+        value = datetime.fromisoformat(value)
+    return value, int(row_id)
+
+def keyset_page(db: Session, model, limit: int, listing: Listing):
+    # Keyset pagination: WHERE <filters> AND (sort, id) > :after ORDER BY sort, id
+    # LIMIT :limit + 1. The extra row only tells us whether there is a next page.
+    rows = db.execute(listing.statement(model, model).limit(limit + 1)).scalars().all()
+    rows, position = listing.next_page(rows, limit, getattr)
+    return {"items": rows, "next_cursor": encode_cursor(listing.sort, position), "position": position}
+
+def _projection(model, columns: Optional[List[str]], *required: str) -> list:
+    # The table columns to SELECT: all of them, or the requested ones plus
+    # those the caller needs itself (cursor, ETag), in table order
+    if columns is None:
+        return list(model.__table__.c)
+    wanted = set(columns) | set(required)
+    return [column for column in model.__table__.c if column.name in wanted]
+
+def _project(row: dict, columns: Optional[List[str]]) -> dict:
+    return row if columns is None else {name: row[name] for name in columns}
+
+def keyset_rows(db: Session, model, limit: int, listing: Listing, columns: Optional[List[str]] = None):
+    # Same page as keyset_page, as plain Core rows (dicts) instead of ORM
+    # objects; `columns` restricts the SELECT to a sparse fieldset
+    statement = listing.statement(model, *_projection(model, columns, "id", listing.sort)).limit(limit + 1)
+    rows = [dict(row) for row in db.execute(statement).mappings()]
+    rows, position = listing.next_page(rows, limit, dict.get)
+    items = [_project(row, columns) for row in rows]
+    return {"items": items, "next_cursor": encode_cursor(listing.sort, position), "position": position}
+
+def get_columns(db: Session, model, row_id: int, columns: List[str]) -> Optional[dict]:
+    # One row with only the requested columns, plus its version for the ETag
+    row = db.execute(select(*_projection(model, columns, "version")).where(model.id == row_id)).one_or_none()
+    return None if row is None else dict(row._mapping)
+
+def stream_rows(
+    model, schema, chunk_size: int, listing: Listing, fast: bool = False, columns: Optional[List[str]] = None,
+):
+    # Streams a JSON array, fetching one keyset chunk at a time so that memory
+    # stays flat whatever the table size. Uses its own session because the
+    # response body is produced after the request dependency has finished.
+    # The fast variant, and any sparse fieldset, encodes Core rows directly
+    # instead of validated models.
+    db = Session(bind=get_engine())
+    try:
+        yield b"["
+        first = True
+        while True:
+            if fast or columns is not None:
+                chunk = keyset_rows(db, model, chunk_size, listing, columns)
+                encoded = [render_json(row) for row in chunk["items"]]
+            else:
+                chunk = keyset_page(db, model, chunk_size, listing)
+                encoded = [schema.model_validate(row).model_dump_json().encode() for row in chunk["items"]]
+                db.expunge_all()
+            if encoded:
+                yield (b"" if first else b",") + b",".join(encoded)
+                first = False
+            if chunk["position"] is None:
+                break
+            listing = replace(listing, after=chunk["position"])
+        yield b"]"
+    finally:
+        db.close()
+
+def bulk_insert(db: Session, model, payloads: List[BaseModel]):
+    # One transaction and one executemany INSERT ... RETURNING id for the whole
+    # batch instead of an add/commit/refresh cycle per row.
+    if not payloads:
+        return {"ids": []}
+    statement = insert(model).returning(model.id, sort_by_parameter_order=True)
+    try:
+        ids = db.execute(statement, [payload.model_dump() for payload in payloads]).scalars().all()
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Bulk insert rejected: {e.orig}")
+    return {"ids": ids}
+
+def insert_rows_each(db: Session, model, rows: List[dict]) -> list:
+    # Group commit: one transaction for rows sent by different requests, each
+    # in its own SAVEPOINT so that a rejected row only fails its own request.
+    # Returns, per row, the inserted row as a dict or the IntegrityError.
+    # An explicit version bump comes first: it opens the transaction (a
+    # SAVEPOINT outside one would commit on release) and takes the write lock.
+    bump_version(db, model)
+    statement = insert(model).returning(*model.__table__.c)
+    results = []
+    for row in rows:
+        try:
+            with db.begin_nested():
+                results.append(dict(db.execute(statement, row).one()._mapping))
+        except IntegrityError as e:
+            results.append(e)
+    db.commit()
+    return results
+
+# Takes `quantity` from the first StorageProducts row of the product that
+# still holds that much. The check and the decrement are one statement, so
+# two concurrent orders can never both take the last units.
+_reserve_stock = (
+    update(StorageProducts)
+    .where(
+        StorageProducts.id == select(StorageProducts.id)
+        .where(StorageProducts.product_id == bindparam("product"), StorageProducts.quantity >= bindparam("wanted"))
+        .order_by(StorageProducts.id)
+        .limit(1)
+        .scalar_subquery(),
+        StorageProducts.quantity >= bindparam("wanted"),
+    )
+    .values(quantity=StorageProducts.quantity - bindparam("wanted"))
+)
+
+def place_order(db: Session, payload: BaseModel) -> int:
+    # Order header, lines and stock reservation in one short transaction. The
+    # stock updates come first: the transaction starts with a write, so it
+    # takes SQLite's write lock up front (waiting up to busy_timeout) instead
+    # of failing to upgrade a read snapshot under contention.
+    fields = payload.model_dump()
+    lines = fields.pop("lines")
+    wanted = {}
+    for line in lines:
+        wanted[line["product_id"]] = wanted.get(line["product_id"], 0) + line["quantity"]
+    try:
+        for product_id, quantity in sorted(wanted.items()):
+            if db.execute(_reserve_stock, {"product": product_id, "wanted": quantity}).rowcount != 1:
+                db.rollback()
+                raise HTTPException(
+                    status_code=409,
+                    detail={"message": "Insufficient stock", "product_id": product_id, "requested": quantity},
+                )
+        order_id = db.execute(insert(Orders).returning(Orders.id), fields).scalar_one()
+        db.execute(insert(OrdersProducts), [dict(line, order_id=order_id) for line in lines])
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Order rejected: {e.orig}")
+    return order_id
+
+def bulk_upsert(db: Session, model, payloads: List[BaseModel]):
+    # Reconciles records by their unique name with one
+    # INSERT ... ON CONFLICT(name) DO UPDATE ... WHERE <something changed>
+    # per batch. Rows whose values are identical are skipped by the WHERE
+    # clause, so RETURNING only reports rows that were inserted or updated;
+    # the names that existed before the batch tell those two apart.
+    rows = list({payload.name: payload.model_dump() for payload in payloads}.values())
+    if not rows:
+        return {"inserted": 0, "updated": 0, "unchanged": 0}
+    columns = [column for column in rows[0] if column != "name"]
+    batch_size = SQLITE_MAX_VARIABLES // len(rows[0])
+    inserted = updated = 0
+    try:
+        # The transaction starts with a write, so it takes the write lock
+        # (waiting up to busy_timeout) before reading the existing names: a
+        # read snapshot could not be upgraded once another writer committed.
+        bump_version(db, model)
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            names = [row["name"] for row in batch]
+            existing = set(db.execute(select(model.name).where(model.name.in_(names))).scalars())
+            statement = sqlite_insert(model).values(batch)
+            changed = or_(*(getattr(model, column).is_distinct_from(statement.excluded[column]) for column in columns))
+            statement = statement.on_conflict_do_update(
+                index_elements=[model.name],
+                set_={**{column: statement.excluded[column] for column in columns}, "version": model.version + 1},
+                where=changed,
+            ).returning(model.name)
+            for name in db.execute(statement).scalars():
+                if name in existing:
+                    updated += 1
+                else:
+                    inserted += 1
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Bulk upsert rejected: {e.orig}")
+    return {"inserted": inserted, "updated": updated, "unchanged": len(rows) - inserted - updated}
+
+def export_ndjson(statement, label: str):
+    # Newline-delimited JSON straight from a server-side cursor (yield_per).
+    # Rows are plain Core tuples serialized once, without going through the
+    # Pydantic Read models, and each partition is written as one bytes chunk.
+    db = Session(bind=get_engine())
+    started = time.perf_counter()
+    count = 0
+    try:
+        result = db.execute(statement.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        for rows in result.partitions():
+            yield b"".join(render_json(row._asdict()) + b"\n" for row in rows)
+            count += len(rows)
+    finally:
+        db.close()
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed > 0 else float(count)
+        log = logger.warning if count >= EXPORT_CHUNK_SIZE and rate < EXPORT_TARGET_ROWS_PER_SEC else logger.info
+        log("%s export: %d rows in %.2fs (%.0f rows/s, target %d)", label, count, elapsed, rate, EXPORT_TARGET_ROWS_PER_SEC)
@@ -0,0 +1,113 @@
+import argparse
+import json
+
+from sqlalchemy.orm import Session
+
+from migrations import LATEST_VERSION, create_or_migrate, current_version, migrate
+from sql import engine_report, get_engine
+
+# Explicit database setup, kept out of the import path of the API:
+#
+#   python manage.py init-db        create missing tables and seed sample data
+#   python manage.py init-db --no-seed
+#   python manage.py migrate        apply pending schema migrations
+#   python manage.py explain        check the query plans of the hot queries
+#   python manage.py rebuild-search re-index Products and Materials for /search
+#   python manage.py rebuild-rollup recompute the DailySales rollup
+#   python manage.py check-rollup   compare the rollup with the order lines
+#   python manage.py report         print the settings the engine runs with
+
+
+def init_db(engine, seed_sample_data: bool = True):
+    # 🔧 Crearea bazei de date
+    applied = create_or_migrate(engine)
+    print("Tabelele au fost create cu succes!")
+    if applied:
+        print(f"Migrations applied: {applied}")
+    if seed_sample_data:
+        # ✅ Popularea bazei de date
+        from seed import seed
+        with Session(bind=engine) as session:
+            added = seed(session)
+        print(f"Seed: {added} rows added")
+
+
+def run_migrations(engine):
+    applied = migrate(engine)
+    with engine.connect() as connection:
+        version = current_version(connection)
+    print(f"Migrations applied: {applied or 'none'} (schema version {version}/{LATEST_VERSION})")
+
+
+def explain(engine) -> bool:
+    from query_plans import check_query_plans
+    ok = True
+    with engine.connect() as connection:
+        for name, (plan, problems) in check_query_plans(connection).items():
+            print(f"{'FAIL' if problems else 'ok  '} {name}")
+            for step in plan:
+                print(f"       {step}")
+            for problem in problems:
+                print(f"       !! {problem}")
+            ok = ok and not problems
+    return ok
+
+
+def rebuild_search(engine):
+    from search import rebuild_search
+    with engine.begin() as connection:
+        rebuild_search(connection)
+    print("Search index rebuilt")
+
+
+def rebuild_rollup(engine):
+    from rollup import rebuild_rollup
+    with engine.begin() as connection:
+        rows = rebuild_rollup(connection)
+    print(f"Rollup rebuilt: {rows} rows")
+
+
+def check_rollup(engine) -> bool:
+    from rollup import check_rollup
+    with engine.connect() as connection:
+        differences = check_rollup(connection)
+    for row in differences:
+        print(json.dumps(row, default=str))
+    print("Rollup consistent" if not differences else f"Rollup differs ({len(differences)} rows shown)")
+    return not differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Database management commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    init = commands.add_parser("init-db", help="create the schema and seed sample data (idempotent)")
+    init.add_argument("--no-seed", action="store_true", help="only create the schema")
+    commands.add_parser("migrate", help="apply pending schema migrations")
+    commands.add_parser("explain", help="check that the hot queries use their indexes")
+    commands.add_parser("rebuild-search", help="rebuild the full-text search index")
+    commands.add_parser("rebuild-rollup", help="recompute the daily sales rollup")
+    commands.add_parser("check-rollup", help="check the daily sales rollup against the order lines")
+    commands.add_parser("report", help="print the engine settings actually applied")
+    args = parser.parse_args(argv)
+
+    engine = get_engine()
+    if args.command == "init-db":
+        init_db(engine, seed_sample_data=not args.no_seed)
+    elif args.command == "migrate":
+        run_migrations(engine)
+    elif args.command == "explain":
+        if not explain(engine):
+            raise SystemExit(1)
+    elif args.command == "rebuild-search":
+        rebuild_search(engine)
+    elif args.command == "rebuild-rollup":
+        rebuild_rollup(engine)
+    elif args.command == "check-rollup":
+        if not check_rollup(engine):
+            raise SystemExit(1)
+    elif args.command == "report":
+        print(json.dumps(engine_report(engine), indent=2))
+
+
+if __name__ == "__main__":
+    main()
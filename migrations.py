@@ -0,0 +1,218 @@
+from sqlalchemy import inspect
+
+from rollup import rebuild_rollup
+from sql import CHANGE_TABLES, SEARCH_TABLES, Base, changelog_ddl, rollup_ddl, search_ddl, table_version_ddl
+
+# Versioned schema migrations for databases created before a model change.
+# The number of the last migration applied is kept in SQLite's
+# PRAGMA user_version; each migration runs in its own transaction together
+# with the version bump. Migrations are written as plain DDL (not derived from
+# the current models) so that they keep meaning the same thing later on.
+
+
+def _create_indexes(connection, indexes):
+    for table, *columns in indexes:
+        name = "_".join(["ix", table, *columns])
+        connection.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({", ".join(columns)})')
+
+
+def migration_001_foreign_key_and_order_indexes(connection):
+    _create_indexes(connection, [
+        ("PlantsProducts", "plant_id"),
+        ("PlantsProducts", "product_id"),
+        ("ProductsMaterials", "product_id"),
+        ("ProductsMaterials", "material_id"),
+        ("PlantsMaterials", "plant_id"),
+        ("PlantsMaterials", "material_id"),
+        ("OrdersProducts", "order_id"),
+        ("OrdersProducts", "product_id"),
+        ("StorageProducts", "product_id"),
+        ("StorageMaterials", "material_id"),
+        ("Orders", "status"),
+        ("Orders", "order_date"),
+        ("Orders", "customer_name"),
+    ])
+
+
+def migration_002_table_versions(connection):
+    connection.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS "TableVersions" ('
+        'name VARCHAR NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (name))'
+    )
+
+
+def migration_003_list_filter_indexes(connection):
+    _create_indexes(connection, [
+        ("Products", "category"),
+        ("Products", "price"),
+        ("Products", "category", "price"),
+        ("Orders", "status", "order_date"),
+        ("Orders", "customer_name", "order_date"),
+    ])
+
+
+def migration_004_full_text_search(connection):
+    # The FTS5 tables hold no data of their own, so the DDL is shared with the
+    # models; the rebuild indexes the rows written before the triggers existed
+    for table in SEARCH_TABLES:
+        for statement in search_ddl(table):
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(f'INSERT INTO "{table}Search"("{table}Search") VALUES (\'rebuild\')')
+
+
+def migration_005_order_lines_covering_index(connection):
+    _create_indexes(connection, [("OrdersProducts", "order_id", "product_id", "quantity")])
+
+
+def migration_006_daily_sales_rollup(connection):
+    connection.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS "DailySales" ('
+        'day DATE NOT NULL, product_id INTEGER NOT NULL, status VARCHAR NOT NULL, '
+        'quantity INTEGER NOT NULL, order_count INTEGER NOT NULL, PRIMARY KEY (day, product_id, status))'
+    )
+    for statement in rollup_ddl():
+        connection.exec_driver_sql(statement)
+    rebuild_rollup(connection)
+
+
+def migration_007_row_versions(connection):
+    for table in ("Plants", "Products", "Materials", "Orders"):
+        connection.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN version INTEGER NOT NULL DEFAULT 1')
+
+
+def migration_008_change_log(connection):
+    # The log starts empty: consumers of an existing database read the tables
+    # once, then follow the feed from its current end
+    connection.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS "ChangeLog" ('
+        'seq INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, entity VARCHAR NOT NULL, row_id INTEGER NOT NULL, '
+        'op VARCHAR NOT NULL, version INTEGER, changed_at DATETIME NOT NULL)'
+    )
+    for table in CHANGE_TABLES:
+        for statement in changelog_ddl(table):
+            connection.exec_driver_sql(statement)
+
+
+def migration_009_table_version_triggers(connection):
+    # Writes that bypassed the API (seed, raw SQL) left the counters behind;
+    # one bump per table makes sure no ETag handed out before is reused
+    for table in CHANGE_TABLES:
+        for statement in table_version_ddl(table):
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(
+            'INSERT INTO "TableVersions"(name, version) '
+            f"VALUES ('{table}', CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)) "
+            'ON CONFLICT(name) DO UPDATE SET version = version + 1'
+        )
+
+
+def migration_010_list_sort_indexes(connection):
+    # (filter, sort) pairs of the list routes that were sorted outside an index
+    _create_indexes(connection, [
+        ("Products", "category", "name"),
+        ("Orders", "status", "customer_name"),
+        ("Orders", "customer_name", "status"),
+        ("Orders", "status", "customer_name", "order_date"),
+    ])
+
+
+# Columns of the entity tables after migration 007, and the columns of other
+# tables that hold their ids
+ENTITY_COLUMNS = {
+    "Plants": "name VARCHAR NOT NULL, location VARCHAR, capacity INTEGER",
+    "Products": "name VARCHAR NOT NULL, description VARCHAR, category VARCHAR NOT NULL, price DECIMAL",
+    "Materials": "name VARCHAR NOT NULL, description VARCHAR, unit VARCHAR, cost DECIMAL",
+    "Orders": "order_date DATETIME NOT NULL, customer_name VARCHAR NOT NULL, status VARCHAR NOT NULL",
+}
+ENTITY_REFERENCES = {
+    "Plants": [("PlantsProducts", "plant_id"), ("PlantsMaterials", "plant_id")],
+    "Products": [("PlantsProducts", "product_id"), ("ProductsMaterials", "product_id"),
+                 ("OrdersProducts", "product_id"), ("StorageProducts", "product_id"), ("DailySales", "product_id")],
+    "Materials": [("ProductsMaterials", "material_id"), ("PlantsMaterials", "material_id"),
+                  ("StorageMaterials", "material_id")],
+    "Orders": [("OrdersProducts", "order_id")],
+}
+
+
+def migration_011_autoincrement_ids(connection):
+    # SQLite cannot add AUTOINCREMENT to a table, so each entity table is
+    # copied out, recreated and copied back; its indexes and triggers are
+    # replayed from the schema afterwards, so that copying back fires none.
+    # Ids still referenced by other rows or by the ChangeLog are marked as
+    # used, so that a new row never takes over the lines of a deleted one.
+    for table, columns in ENTITY_COLUMNS.items():
+        names = ", ".join(["id", *(column.split()[0] for column in columns.split(", ")), "version"])
+        schema = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+            (table,),
+        ).scalars().all()
+        connection.exec_driver_sql(f'CREATE TEMP TABLE "{table}_copy" AS SELECT {names} FROM "{table}"')
+        connection.exec_driver_sql(f'DROP TABLE "{table}"')
+        unique = ", UNIQUE (name)" if table != "Orders" else ""
+        connection.exec_driver_sql(
+            f'CREATE TABLE "{table}" (id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, {columns}, '
+            f"version INTEGER NOT NULL DEFAULT 1{unique})"
+        )
+        connection.exec_driver_sql(f'INSERT INTO "{table}"({names}) SELECT {names} FROM temp."{table}_copy"')
+        connection.exec_driver_sql(f'DROP TABLE temp."{table}_copy"')
+        for statement in schema:
+            connection.exec_driver_sql(statement)
+        used = [f'(SELECT max(id) FROM "{table}")',
+                f"(SELECT max(row_id) FROM \"ChangeLog\" WHERE entity = '{table.lower()}')"]
+        used += [f'(SELECT max({column}) FROM "{child}")' for child, column in ENTITY_REFERENCES[table]]
+        connection.exec_driver_sql(f"DELETE FROM sqlite_sequence WHERE name = '{table}'")
+        connection.exec_driver_sql(
+            f"INSERT INTO sqlite_sequence(name, seq) VALUES ('{table}', "
+            f"max({', '.join(f'coalesce({value}, 0)' for value in used)}))"
+        )
+
+
+MIGRATIONS = [
+    migration_001_foreign_key_and_order_indexes,
+    migration_002_table_versions,
+    migration_003_list_filter_indexes,
+    migration_004_full_text_search,
+    migration_005_order_lines_covering_index,
+    migration_006_daily_sales_rollup,
+    migration_007_row_versions,
+    migration_008_change_log,
+    migration_009_table_version_triggers,
+    migration_010_list_sort_indexes,
+    migration_011_autoincrement_ids,
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def current_version(connection) -> int:
+    return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def stamp(engine, version: int = LATEST_VERSION):
+    with engine.begin() as connection:
+        connection.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def migrate(engine):
+    # Applies the pending migrations in order and returns their versions
+    applied = []
+    with engine.connect() as connection:
+        version = current_version(connection)
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with engine.begin() as connection:
+            migration(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+        applied.append(number)
+    return applied
+
+
+def create_or_migrate(engine):
+    # A brand new database gets the current schema straight from the models and
+    # is stamped as up to date; an existing one only gets the missing tables
+    # and then the pending migrations.
+    fresh = not inspect(engine).get_table_names()
+    Base.metadata.create_all(engine)
+    if fresh:
+        stamp(engine)
+        return []
+    return migrate(engine)
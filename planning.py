@@ -0,0 +1,269 @@
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from sql import Materials, Orders, OrdersProducts, Plants, PlantsProducts, ProductsMaterials, StorageMaterials
+
+# Planning services over the association tables. They work on NumPy arrays
+# built from a handful of aggregate queries rather than on ORM objects, and
+# can be called directly with a Session or through the /planning routes.
+
+# Keeps IN lists below SQLite's default bound-variable limit
+ORDER_ID_CHUNK = 900
+
+# Buckets the scheduler looks at first for each line; doubled until the line fits
+SCHEDULE_WINDOW = 8
+
+
+def _ids(rows, column):
+    return np.fromiter((row[column] for row in rows), dtype=np.int64, count=len(rows))
+
+
+def _quantities(rows, column):
+    return np.fromiter((float(row[column] or 0) for row in rows), dtype=np.float64, count=len(rows))
+
+
+def _demand_by_product(db: Session, order_ids, date_from, date_to, include_cancelled):
+    # Total ordered quantity per product for the selected orders, summed in SQL
+    def query(ids=None):
+        statement = (
+            select(OrdersProducts.product_id, func.sum(OrdersProducts.quantity))
+            .join(Orders, Orders.id == OrdersProducts.order_id)
+            .where(OrdersProducts.product_id.is_not(None))
+            .group_by(OrdersProducts.product_id)
+        )
+        if ids is not None:
+            statement = statement.where(Orders.id.in_(ids))
+        if date_from is not None:
+            statement = statement.where(Orders.order_date >= date_from)
+        if date_to is not None:
+            statement = statement.where(Orders.order_date < date_to)
+        if not include_cancelled:
+            statement = statement.where(Orders.status != "Cancelled")
+        return db.execute(statement).all()
+
+    if order_ids is None:
+        rows = query()
+    else:
+        ids = sorted(set(order_ids))
+        rows = [row for start in range(0, len(ids), ORDER_ID_CHUNK) for row in query(ids[start:start + ORDER_ID_CHUNK])]
+    product_ids, quantities = _ids(rows, 0), _quantities(rows, 1)
+    # chunks may repeat a product: collapse to one entry per product, sorted by id
+    product_ids, inverse = np.unique(product_ids, return_inverse=True)
+    return product_ids, np.bincount(inverse, weights=quantities, minlength=len(product_ids))
+
+
+def material_requirements(
+    db: Session,
+    order_ids: Optional[Iterable[int]] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    include_cancelled: bool = False,
+    only_shortfalls: bool = False,
+) -> List[dict]:
+    # Bill of materials explosion: gross[m] = sum_p demand[p] * bom[p, m],
+    # computed as a sparse (COO) matrix-vector product with bincount, then
+    # netted against the stock in StorageMaterials.
+    product_ids, demand = _demand_by_product(db, order_ids, date_from, date_to, include_cancelled)
+    if not len(product_ids):
+        return []
+
+    bom = db.execute(
+        select(ProductsMaterials.product_id, ProductsMaterials.material_id, ProductsMaterials.quantity)
+        .where(ProductsMaterials.product_id.is_not(None), ProductsMaterials.material_id.is_not(None))
+    ).all()
+    bom_products, bom_materials, bom_quantities = _ids(bom, 0), _ids(bom, 1), _quantities(bom, 2)
+
+    # keep the BOM entries of demanded products and look up their demand
+    positions = np.searchsorted(product_ids, bom_products)
+    positions[positions == len(product_ids)] = 0
+    used = product_ids[positions] == bom_products
+    if not used.any():
+        return []
+    material_ids, material_index = np.unique(bom_materials[used], return_inverse=True)
+    gross = np.bincount(
+        material_index,
+        weights=demand[positions[used]] * bom_quantities[used],
+        minlength=len(material_ids),
+    )
+
+    stock_rows = db.execute(
+        select(StorageMaterials.material_id, func.sum(StorageMaterials.quantity))
+        .where(StorageMaterials.material_id.is_not(None))
+        .group_by(StorageMaterials.material_id)
+    ).all()
+    stock_ids, stock_quantities = _ids(stock_rows, 0), _quantities(stock_rows, 1)
+    order = np.argsort(stock_ids)
+    stock_ids, stock_quantities = stock_ids[order], stock_quantities[order]
+    stock = np.zeros(len(material_ids))
+    if len(stock_ids):
+        positions = np.searchsorted(stock_ids, material_ids)
+        positions[positions == len(stock_ids)] = 0
+        found = stock_ids[positions] == material_ids
+        stock[found] = stock_quantities[positions[found]]
+    shortfall = np.maximum(gross - stock, 0)
+
+    names = dict(
+        (row[0], (row[1], row[2]))
+        for row in db.execute(
+            select(Materials.id, Materials.name, Materials.unit).where(
+                Materials.id.in_(select(ProductsMaterials.material_id).distinct())
+            )
+        )
+    )
+    keep = shortfall > 0 if only_shortfalls else np.ones(len(material_ids), dtype=bool)
+    return [
+        {
+            "material_id": int(material_id),
+            "name": names.get(int(material_id), (None, None))[0],
+            "unit": names.get(int(material_id), (None, None))[1],
+            "required": float(required),
+            "in_stock": float(available),
+            "shortfall": float(missing),
+        }
+        for material_id, required, available, missing in zip(
+            material_ids[keep], gross[keep], stock[keep], shortfall[keep]
+        )
+    ]
+
+
+def _capacity_tables(db: Session):
+    # Rates per (plant, product) summed over duplicate PlantsProducts rows,
+    # sorted by product then plant; capacity per plant, inf when not set
+    rates = db.execute(
+        select(PlantsProducts.product_id, PlantsProducts.plant_id, func.sum(PlantsProducts.quantity))
+        .where(PlantsProducts.product_id.is_not(None), PlantsProducts.plant_id.is_not(None))
+        .group_by(PlantsProducts.product_id, PlantsProducts.plant_id)
+        .order_by(PlantsProducts.product_id, PlantsProducts.plant_id)
+    ).all()
+    plants = db.execute(select(Plants.id, Plants.capacity).order_by(Plants.id)).all()
+    plant_ids = _ids(plants, 0)
+    capacity = np.array([np.inf if row[1] is None else float(row[1]) for row in plants], dtype=np.float64)
+    return _ids(rates, 0), _ids(rates, 1), _quantities(rates, 2), plant_ids, capacity
+
+
+def schedule_production(
+    db: Session,
+    order_ids: Optional[Iterable[int]] = None,
+    statuses: Iterable[str] = ("Pending",),
+    start: Optional[datetime] = None,
+    bucket_hours: int = 24,
+    horizon: int = 60,
+    lead_time_days: float = 7,
+) -> dict:
+    # Greedy earliest-due-date schedule. Orders are due lead_time_days after
+    # they were placed and are taken in due date order (ties by id); each
+    # line is split over the plants able to make its product, filling the
+    # earliest buckets first. A plant makes at most its PlantsProducts
+    # quantity of a product and at most its capacity in total per bucket.
+    # Lines that do not fit in the horizon are reported as unscheduled.
+    statement = (
+        select(Orders.id, Orders.order_date, OrdersProducts.id, OrdersProducts.product_id, OrdersProducts.quantity)
+        .join(OrdersProducts, OrdersProducts.order_id == Orders.id)
+        .where(Orders.status.in_(list(statuses)), OrdersProducts.product_id.is_not(None), OrdersProducts.quantity > 0)
+        .order_by(Orders.id, OrdersProducts.id)
+    )
+    if order_ids is not None:
+        ids = sorted(set(order_ids))
+        lines = [
+            row for chunk in range(0, len(ids), ORDER_ID_CHUNK)
+            for row in db.execute(statement.where(Orders.id.in_(ids[chunk:chunk + ORDER_ID_CHUNK])))
+        ]
+    else:
+        lines = db.execute(statement).all()
+    if not lines:
+        return {"start": start, "bucket_hours": bucket_hours, "assignments": [], "orders": [], "unscheduled": []}
+
+    if start is None:
+        start = min(row[1] for row in lines)
+    bucket = timedelta(hours=bucket_hours)
+    lead_time = timedelta(days=lead_time_days)
+    rate_products, rate_plants, rates, plant_ids, capacity = _capacity_tables(db)
+    plant_index = np.searchsorted(plant_ids, rate_plants)
+    known = (plant_index < len(plant_ids)) & (plant_ids[np.minimum(plant_index, len(plant_ids) - 1)] == rate_plants)
+    rate_products, rate_plants, rates, plant_index = (
+        rate_products[known], rate_plants[known], rates[known], plant_index[known]
+    )
+
+    # remaining room per bucket: rate_left per (plant, product) row, capacity_left per plant
+    rate_left = np.repeat(rates[:, None], horizon, axis=1)
+    capacity_left = np.repeat(capacity[:, None], horizon, axis=1)
+    first_free = {}  # product -> earliest bucket that may still have room
+    boundaries = np.flatnonzero(np.diff(rate_products)) + 1
+    product_rows = {
+        int(rate_products[rows[0]]): (rows, plant_index[rows])
+        for rows in np.split(np.arange(len(rate_products)), boundaries) if len(rows)
+    }
+    no_rows = (np.arange(0), np.arange(0))
+
+    lines.sort(key=lambda row: (row[1] + lead_time, row[0], row[2]))
+    assignments, unscheduled, completion = [], [], {}
+    for order_id, order_date, line_id, product_id, quantity in lines:
+        rows, plants = product_rows.get(product_id, no_rows)
+        release = max(0, int((order_date - start) // bucket))
+        first = max(release, first_free.get(product_id, 0))
+        remaining = float(quantity)
+        stop, free = first, None
+        # scan the buckets in growing windows, so that a line that fits early
+        # does not look at the whole horizon
+        window = SCHEDULE_WINDOW
+        while len(rows) and remaining > 1e-9 and stop < horizon:
+            low, stop = stop, min(horizon, stop + window)
+            window *= 2
+            room = np.minimum(rate_left[rows, low:stop], capacity_left[plants, low:stop])
+            # bucket-major order: fill a bucket across all plants before the next one
+            flat = room.T.ravel()
+            taken = np.minimum(flat, np.maximum(remaining - (np.cumsum(flat) - flat), 0)).reshape(room.T.shape).T
+            rate_left[rows, low:stop] -= taken
+            capacity_left[plants, low:stop] -= taken
+            for offset, position in zip(*np.nonzero(taken.T > 0)):
+                index = low + int(offset)
+                assignments.append({
+                    "order_id": order_id,
+                    "line_id": line_id,
+                    "product_id": product_id,
+                    "plant_id": int(plant_ids[plants[position]]),
+                    "bucket": index,
+                    "bucket_start": start + index * bucket,
+                    "quantity": float(taken[position, offset]),
+                })
+                end = start + (index + 1) * bucket
+                completion[order_id] = max(completion.get(order_id, end), end)
+            remaining -= float(taken.sum())
+            if free is None:
+                left = np.nonzero((room - taken > 0).any(axis=0))[0]
+                free = low + int(left[0]) if len(left) else None
+        if release <= first_free.get(product_id, 0):
+            # no room for this product anywhere before this bucket
+            first_free[product_id] = stop if free is None else free
+        if remaining > 1e-9:
+            unscheduled.append({
+                "order_id": order_id,
+                "line_id": line_id,
+                "product_id": product_id,
+                "quantity": remaining,
+                "reason": "no plant makes this product" if not len(rows) else "does not fit in the horizon",
+            })
+
+    unscheduled_orders = {line["order_id"] for line in unscheduled}
+    orders = []
+    for order_id, order_date in sorted({(row[0], row[1]) for row in lines}, key=lambda item: (item[1] + lead_time, item[0])):
+        due = order_date + lead_time
+        done = completion.get(order_id)
+        late = None if done is None else max(done - due, timedelta(0)).total_seconds() / 86400
+        orders.append({
+            "order_id": order_id,
+            "due": due,
+            "completion": None if order_id in unscheduled_orders else done,
+            "lateness_days": None if order_id in unscheduled_orders else late,
+        })
+    return {
+        "start": start,
+        "bucket_hours": bucket_hours,
+        "assignments": assignments,
+        "orders": orders,
+        "unscheduled": unscheduled,
+    }
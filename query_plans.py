@@ -0,0 +1,233 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import combinations
+from typing import Dict, List
+
+from sqlalchemy import text
+
+import crud
+import reports
+from sql import Orders, Products
+
+# EXPLAIN QUERY PLAN assertions for the hot queries of the API. A query fails
+# when SQLite plans a full table scan ("SCAN <table>" without an index) on a
+# table it should search, or when an expected index is not used. A query
+# that must come out in index order also fails when SQLite sorts the
+# matching rows itself ("USE TEMP B-TREE FOR ORDER BY"): every page would
+# read and sort the whole filter result.
+#
+# The list routes are checked for every combination of their filters, sort
+# columns and directions that they accept, built by the same crud functions
+# and selecting the same columns as the routes.
+#
+#   python manage.py explain
+
+
+@dataclass
+class HotQuery:
+    name: str
+    sql: str
+    params: Dict[str, object] = field(default_factory=dict)
+    indexes: List[str] = field(default_factory=list)
+    ordered: bool = False  # rows must come in index order, without a sort step
+
+
+HOT_QUERIES = [
+    HotQuery(
+        "order lines by order",
+        'SELECT * FROM "OrdersProducts" WHERE order_id = :id',
+        {"id": 1},
+        ["ix_OrdersProducts_order_id"],
+    ),
+    HotQuery(
+        "order lines by product",
+        'SELECT * FROM "OrdersProducts" WHERE product_id = :id',
+        {"id": 1},
+        ["ix_OrdersProducts_product_id"],
+    ),
+    HotQuery(
+        "orders by status",
+        'SELECT * FROM "Orders" WHERE status = :status',
+        {"status": "Pending"},
+        ["ix_Orders_status"],
+    ),
+    HotQuery(
+        "orders by customer",
+        'SELECT * FROM "Orders" WHERE customer_name = :name',
+        {"name": "Alice Johnson"},
+        ["ix_Orders_customer_name"],
+    ),
+    HotQuery(
+        "orders by date range",
+        'SELECT * FROM "Orders" WHERE order_date >= :start AND order_date < :end',
+        {"start": "2023-01-01", "end": "2023-02-01"},
+        ["ix_Orders_order_date"],
+    ),
+    HotQuery(
+        "lines of orders in a date range",
+        'SELECT op.* FROM "Orders" o JOIN "OrdersProducts" op ON op.order_id = o.id '
+        'WHERE o.order_date >= :start AND o.order_date < :end',
+        {"start": "2023-01-01", "end": "2023-02-01"},
+        ["ix_Orders_order_date", "ix_OrdersProducts_order_id"],
+    ),
+    HotQuery(
+        "bill of materials of a product",
+        'SELECT * FROM "ProductsMaterials" WHERE product_id = :id',
+        {"id": 1},
+        ["ix_ProductsMaterials_product_id"],
+    ),
+    HotQuery(
+        "products using a material",
+        'SELECT * FROM "ProductsMaterials" WHERE material_id = :id',
+        {"id": 1},
+        ["ix_ProductsMaterials_material_id"],
+    ),
+    HotQuery(
+        "plants making a product",
+        'SELECT * FROM "PlantsProducts" WHERE product_id = :id',
+        {"id": 1},
+        ["ix_PlantsProducts_product_id"],
+    ),
+    HotQuery(
+        "products of a plant",
+        'SELECT * FROM "PlantsProducts" WHERE plant_id = :id',
+        {"id": 1},
+        ["ix_PlantsProducts_plant_id"],
+    ),
+    HotQuery(
+        "plants holding a material",
+        'SELECT * FROM "PlantsMaterials" WHERE material_id = :id',
+        {"id": 1},
+        ["ix_PlantsMaterials_material_id"],
+    ),
+    HotQuery(
+        "materials of a plant",
+        'SELECT * FROM "PlantsMaterials" WHERE plant_id = :id',
+        {"id": 1},
+        ["ix_PlantsMaterials_plant_id"],
+    ),
+    HotQuery(
+        "product stock",
+        'SELECT * FROM "StorageProducts" WHERE product_id = :id',
+        {"id": 1},
+        ["ix_StorageProducts_product_id"],
+    ),
+    HotQuery(
+        "material stock",
+        'SELECT * FROM "StorageMaterials" WHERE material_id = :id',
+        {"id": 1},
+        ["ix_StorageMaterials_material_id"],
+    ),
+    HotQuery(
+        "change feed after a seq",
+        'SELECT * FROM "ChangeLog" WHERE seq > :since ORDER BY seq LIMIT 100',
+        {"since": 1},
+        ordered=True,
+    ),
+]
+
+
+# Sample values for each filter of the list routes
+LIST_FILTERS = {
+    Orders: (crud.order_filters, {
+        "status": ["Pending"],
+        "customer_name": "Alice Johnson",
+        "order_date_from": datetime(2023, 1, 1),
+        "order_date_to": datetime(2023, 2, 1),
+    }),
+    Products: (crud.product_filters, {
+        "category": ["Electronics", "Beverage"],
+        "price_min": 10,
+        "price_max": 100,
+    }),
+}
+
+# Sort value of the last row of a previous page, for the next-page queries
+CURSOR_SAMPLES = {
+    Orders: {"id": None, "order_date": datetime(2023, 1, 15), "customer_name": "Alice Johnson", "status": "Pending"},
+    Products: {"id": None, "name": "Laptop", "category": "Electronics", "price": 50},
+}
+
+# Filters that are only ever given together count as one
+FILTER_GROUPS = {
+    Orders: [("status",), ("customer_name",), ("order_date_from", "order_date_to")],
+    Products: [("category",), ("price_min", "price_max")],
+}
+
+
+def listing_queries():
+    # One HotQuery per filter subset x sort column x direction x first/next page
+    # accepted by crud.check_index_order. The unfiltered first page in id
+    # order is a plain walk of the table and is the only query allowed to
+    # scan it.
+    queries = []
+    for model, (build, values) in LIST_FILTERS.items():
+        groups = FILTER_GROUPS[model]
+        for size in range(len(groups) + 1):
+            for subset in combinations(groups, size):
+                names = [name for group in subset for name in group]
+                conditions = build(**{name: values[name] for name in names})
+                for sort in crud.SORTABLE[model]:
+                    for descending in (False, True):
+                        for after in (None, (CURSOR_SAMPLES[model][sort], 1)):
+                            if not conditions and sort == "id" and after is None:
+                                continue
+                            listing = crud.Listing(conditions, sort, descending, after)
+                            if not crud.index_order_available(model, listing):
+                                continue
+                            statement = listing.statement(model, model).limit(101)
+                            compiled = statement.compile(compile_kwargs={"literal_binds": True})
+                            queries.append(HotQuery(
+                                f"{model.__tablename__} list [{', '.join(names) or 'no filter'}]"
+                                f" sort {'-' if descending else ''}{sort}{' after' if after else ''}",
+                                str(compiled),
+                                ordered=True,
+                            ))
+    return queries
+
+
+def report_queries():
+    # The revenue report over a date range reads the orders through a date
+    # index and their lines through the covering index, never the base table
+    # index only; the rollup is read through its (day, product_id, status) key
+    date_range = (datetime(2023, 1, 1).date(), datetime(2023, 1, 31).date())
+    return [
+        HotQuery(
+            "revenue report by category and month",
+            str(reports.revenue_statement(["category", "month"], *date_range).compile(compile_kwargs={"literal_binds": True})),
+            indexes=["ix_OrdersProducts_order_id_product_id_quantity"],
+        ),
+        HotQuery(
+            "revenue report by product from the rollup",
+            str(reports.rollup_statement(["product", "month"], *date_range).compile(compile_kwargs={"literal_binds": True})),
+            indexes=["sqlite_autoindex_DailySales_1"],
+        ),
+    ]
+
+
+def query_plan(connection, sql: str, params=None) -> List[str]:
+    return [row[-1] for row in connection.execute(text("EXPLAIN QUERY PLAN " + sql), params or {})]
+
+
+def plan_problems(plan: List[str], indexes: List[str], ordered: bool = False) -> List[str]:
+    problems = []
+    for step in plan:
+        words = step.split()
+        if words[:1] == ["SCAN"] and "INDEX" not in words:
+            problems.append(f"full table scan: {step}")
+        if ordered and step.startswith("USE TEMP B-TREE FOR") and "ORDER BY" in step:
+            problems.append(f"sorted outside an index: {step}")
+    joined = "\n".join(plan)
+    problems.extend(f"index not used: {index}" for index in indexes if index not in joined)
+    return problems
+
+
+def check_query_plans(connection, queries=None):
+    # Returns {query name: (plan, problems)} for every checked query
+    if queries is None:
+        queries = HOT_QUERIES + listing_queries() + report_queries()
+    results = {}
+    for query in queries:
+        plan = query_plan(connection, query.sql, query.params)
+        results[query.name] = (plan, plan_problems(plan, query.indexes, query.ordered))
+    return results
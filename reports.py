@@ -0,0 +1,107 @@
+from datetime import date, datetime, time, timedelta
+from typing import List, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from sql import DailySales, Orders, OrdersProducts, Products
+
+# Sales reports aggregated in SQLite: one GROUP BY over the order lines of
+# the selected orders, joined to Products for the price. Revenue is
+# quantity x the current Products.price, as on the order detail route.
+#
+# Reports grouped by product (and not by customer) read the DailySales
+# rollup instead: a few rows per product and day rather than every line.
+# Its order counts are per product, so they only add up when the product
+# stays one of the groups.
+
+# name -> columns, given the date column of the source (Orders.order_date or DailySales.day)
+DIMENSIONS = {
+    "product": lambda day: [Products.id.label("product_id"), Products.name.label("product_name")],
+    "category": lambda day: [Products.category.label("category")],
+    "customer": lambda day: [Orders.customer_name.label("customer_name")],
+    "month": lambda day: [func.strftime("%Y-%m", day).label("month")],
+}
+
+
+def uses_rollup(group_by: List[str]) -> bool:
+    return "product" in group_by and "customer" not in group_by
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _columns(group_by: List[str], day) -> list:
+    # dimensions keep the order of DIMENSIONS
+    return [column for name in DIMENSIONS if name in group_by for column in DIMENSIONS[name](day)]
+
+
+def rollup_statement(
+    group_by: List[str],
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    exclude_cancelled: bool = True,
+):
+    columns = _columns(group_by, DailySales.day)
+    statement = (
+        select(
+            *columns,
+            func.coalesce(func.sum(DailySales.quantity), 0).label("quantity"),
+            func.coalesce(func.sum(DailySales.quantity * Products.price), 0).label("revenue"),
+            func.coalesce(func.sum(DailySales.order_count), 0).label("order_count"),
+        )
+        .select_from(DailySales)
+        .join(Products, Products.id == DailySales.product_id)
+    )
+    if date_from is not None:
+        statement = statement.where(DailySales.day >= date_from)
+    if date_to is not None:
+        statement = statement.where(DailySales.day <= date_to)
+    if exclude_cancelled:
+        statement = statement.where(DailySales.status != "Cancelled")
+    if columns:
+        statement = statement.group_by(*columns).order_by(*columns)
+    return statement
+
+
+def revenue_statement(
+    group_by: List[str],
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    exclude_cancelled: bool = True,
+):
+    # date_to is inclusive
+    columns = _columns(group_by, Orders.order_date)
+    statement = (
+        select(
+            *columns,
+            func.coalesce(func.sum(OrdersProducts.quantity), 0).label("quantity"),
+            func.coalesce(func.sum(OrdersProducts.quantity * Products.price), 0).label("revenue"),
+            func.count(func.distinct(Orders.id)).label("order_count"),
+        )
+        .select_from(Orders)
+        .join(OrdersProducts, OrdersProducts.order_id == Orders.id)
+        .join(Products, Products.id == OrdersProducts.product_id)
+    )
+    if date_from is not None:
+        statement = statement.where(Orders.order_date >= _day_start(date_from))
+    if date_to is not None:
+        statement = statement.where(Orders.order_date < _day_start(date_to + timedelta(days=1)))
+    if exclude_cancelled:
+        statement = statement.where(Orders.status != "Cancelled")
+    if columns:
+        statement = statement.group_by(*columns).order_by(*columns)
+    return statement
+
+
+def revenue(
+    db: Session,
+    group_by: List[str],
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    exclude_cancelled: bool = True,
+) -> List[dict]:
+    build = rollup_statement if uses_rollup(group_by) else revenue_statement
+    statement = build(group_by, date_from, date_to, exclude_cancelled)
+    return [dict(row) for row in db.execute(statement).mappings()]
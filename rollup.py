@@ -0,0 +1,37 @@
+from typing import List
+
+# Maintenance of the DailySales rollup (see DailySales and rollup_ddl in
+# sql.py). The triggers keep it current; these are for the first fill after
+# the migration and for auditing it against the order lines.
+#
+#   python manage.py rebuild-rollup
+#   python manage.py check-rollup
+
+# The rollup as it should be, computed from the order lines
+EXPECTED = (
+    'SELECT date(o.order_date) AS day, op.product_id AS product_id, o.status AS status, '
+    'sum(coalesce(op.quantity, 0)) AS quantity, count(DISTINCT o.id) AS order_count '
+    'FROM "OrdersProducts" op JOIN "Orders" o ON o.id = op.order_id '
+    'WHERE op.product_id IS NOT NULL GROUP BY 1, 2, 3'
+)
+
+ACTUAL = 'SELECT day, product_id, status, quantity, order_count FROM "DailySales"'
+
+
+def rebuild_rollup(connection) -> int:
+    connection.exec_driver_sql('DELETE FROM "DailySales"')
+    result = connection.exec_driver_sql(
+        f'INSERT INTO "DailySales"(day, product_id, status, quantity, order_count) {EXPECTED}'
+    )
+    return result.rowcount
+
+
+def check_rollup(connection, limit: int = 100) -> List[dict]:
+    # Rows that differ between the rollup and a recomputation, at most `limit`;
+    # "source" says which side the row comes from
+    rows = connection.exec_driver_sql(
+        f"SELECT 'missing or wrong in rollup' AS source, * FROM ({EXPECTED} EXCEPT {ACTUAL}) "
+        f"UNION ALL SELECT 'stale in rollup', * FROM ({ACTUAL} EXCEPT {EXPECTED}) "
+        f"ORDER BY day, product_id, status LIMIT {int(limit)}"
+    ).mappings()
+    return [dict(row) for row in rows]
@@ -0,0 +1,59 @@
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from sql import SEARCH_TABLES
+
+# Full-text search over the FTS5 indexes of Products and Materials (see
+# search_ddl in sql.py). Results from both tables are merged by bm25 score;
+# each table is asked for its own top offset + limit matches only, which FTS5
+# answers from the index without ranking every matching row.
+#
+#   python manage.py rebuild-search    re-index after writes that bypassed SQLite
+
+KINDS = {"products": "Products", "materials": "Materials"}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def match_expression(q: str) -> Optional[str]:
+    # Every word of the query must match, as a prefix of an indexed token.
+    # Words are quoted so that FTS5 operators typed by users are plain text.
+    words = _WORD.findall(q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _kind_query(table: str, kind: str) -> str:
+    fts = f"{table}Search"
+    return (
+        f"SELECT * FROM (SELECT '{kind}' AS kind, t.id AS id, t.name AS name, "
+        f'  t.description AS description, -"{fts}".rank AS score '
+        f'FROM "{fts}" JOIN "{table}" t ON t.id = "{fts}".rowid '
+        f'WHERE "{fts}" MATCH :q ORDER BY "{fts}".rank LIMIT :window)'
+    )
+
+
+def search(db: Session, q: str, kinds: Optional[List[str]] = None, limit: int = 20, offset: int = 0) -> dict:
+    expression = match_expression(q)
+    if expression is None:
+        return {"items": [], "next_offset": None}
+    selected = [kind for kind in KINDS if not kinds or kind in kinds]
+    sql = " UNION ALL ".join(_kind_query(KINDS[kind], kind) for kind in selected)
+    rows = db.execute(
+        text(f"{sql} ORDER BY score DESC, kind, id LIMIT :limit OFFSET :offset"),
+        {"q": expression, "window": offset + limit + 1, "limit": limit + 1, "offset": offset},
+    ).mappings().all()
+    items = [dict(row) for row in rows[:limit]]
+    return {"items": items, "next_offset": offset + limit if len(rows) > limit else None}
+
+
+def rebuild_search(connection):
+    # Re-reads every row of the base tables, then merges the index segments
+    for table in SEARCH_TABLES:
+        fts = f"{table}Search"
+        connection.exec_driver_sql(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+        connection.exec_driver_sql(f'INSERT INTO "{fts}"("{fts}") VALUES (\'optimize\')')
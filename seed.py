@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from sql import (
+    Materials, Orders, OrdersProducts, Plants, PlantsMaterials, PlantsProducts,
+    Products, ProductsMaterials, StorageMaterials, StorageProducts,
+)
+
+def seed_data():
+    # In dependency order: the association rows refer to the ids of the rows above them
+    return [
+        [
+            Plants(name='Green Valley Plant', location='Springfield, IL', capacity=1000),
+            Plants(name='Herbal Remedies Factory', location='Madison, WI', capacity=1500),
+            Plants(name='Natural Extracts Co.', location='Boulder, CO', capacity=2000),
+            Plants(name='Pure Essence Plants', location='Austin, TX', capacity=1200),
+            Plants(name='Botanical Ingredients Inc.', location='Seattle, WA', capacity=1800),
+        ],
+        [
+            Products(name='Herbal Tea', description='A soothing herbal tea blend.', category='Beverage', price=5.99),
+            Products(name='Natural Shampoo', description='Shampoo made from natural ingredients.', category='Cosmetics', price=12.99),
+            Products(name='Essential Oil', description='Pure essential oil for aromatherapy.', category='Aromatherapy', price=15.99),
+            Products(name='Herbal Extract', description='Concentrated herbal extract for health benefits.', category='Supplements', price=20.99),
+            Products(name='Organic Soap', description='Handmade organic soap with natural ingredients.', category='Cosmetics', price=7.49),
+        ],
+        [
+            PlantsProducts(plant_id=1, product_id=1, quantity=200),
+            PlantsProducts(plant_id=1, product_id=2, quantity=150),
+            PlantsProducts(plant_id=2, product_id=3, quantity=300),
+            PlantsProducts(plant_id=3, product_id=4, quantity=100),
+            PlantsProducts(plant_id=4, product_id=5, quantity=250),
+        ],
+        [
+            Materials(name='Chamomile', description='Dried chamomile flowers.', unit='grams', cost=2.50),
+            Materials(name='Lavender', description='Dried lavender flowers.', unit='grams', cost=3.00),
+            Materials(name='Coconut Oil', description='Organic coconut oil.', unit='liters', cost=10.00),
+            Materials(name='Aloe Vera', description='Fresh aloe vera gel.', unit='liters', cost=8.00),
+            Materials(name='Olive Oil', description='Extra virgin olive oil.', unit='liters', cost=12.00),
+        ],
+        [
+            ProductsMaterials(product_id=1, material_id=1, quantity=50),
+            ProductsMaterials(product_id=2, material_id=3, quantity=30),
+            ProductsMaterials(product_id=3, material_id=2, quantity=20),
+            ProductsMaterials(product_id=4, material_id=4, quantity=25),
+            ProductsMaterials(product_id=5, material_id=5, quantity=10),
+        ],
+        [
+            PlantsMaterials(plant_id=1, material_id=1, quantity=100),
+            PlantsMaterials(plant_id=2, material_id=2, quantity=80),
+            PlantsMaterials(plant_id=3, material_id=3, quantity=150),
+            PlantsMaterials(plant_id=4, material_id=4, quantity=90),
+            PlantsMaterials(plant_id=5, material_id=5, quantity=120),
+        ],
+        [
+            StorageProducts(product_id=1, quantity=500),
+            StorageProducts(product_id=2, quantity=300),
+            StorageProducts(product_id=3, quantity=400),
+            StorageProducts(product_id=4, quantity=200),
+            StorageProducts(product_id=5, quantity=600),
+        ],
+        [
+            StorageMaterials(material_id=1, quantity=150),
+            StorageMaterials(material_id=2, quantity=100),
+            StorageMaterials(material_id=3, quantity=200),
+            StorageMaterials(material_id=4, quantity=180),
+            StorageMaterials(material_id=5, quantity=220),
+        ],
+        [
+            Orders(order_date=datetime(2023, 1, 15), customer_name='Alice Johnson', status='Completed'),
+            Orders(order_date=datetime(2023, 2, 20), customer_name='Bob Smith', status='Pending'),
+            Orders(order_date=datetime(2023, 3, 5), customer_name='Charlie Brown', status='Shipped'),
+            Orders(order_date=datetime(2023, 4, 10), customer_name='Diana Prince', status='Completed'),
+            Orders(order_date=datetime(2023, 5, 25), customer_name='Ethan Hunt', status='Cancelled'),
+        ],
+        [
+            OrdersProducts(order_id=1, product_id=1, quantity=2),
+            OrdersProducts(order_id=1, product_id=3, quantity=1),
+            OrdersProducts(order_id=2, product_id=2, quantity=3),
+            OrdersProducts(order_id=3, product_id=4, quantity=2),
+            OrdersProducts(order_id=4, product_id=5, quantity=5),
+        ],
+    ]
+
+def seed(session: Session):
+    # Idempotent: named rows are only added when their name is missing, the
+    # other tables only when they are still empty.
+    added = 0
+    for rows in seed_data():
+        model = type(rows[0])
+        if hasattr(model, "name"):
+            existing = set(session.scalars(select(model.name)))
+            rows = [row for row in rows if row.name not in existing]
+        elif session.scalar(select(model.id).limit(1)) is not None:
+            rows = []
+        session.add_all(rows)
+        session.flush()
+        added += len(rows)
+    session.commit()
+    return added
@@ -1,13 +1,92 @@
-import os
-from sqlalchemy import DECIMAL, Column, DateTime, ForeignKey, Integer, String, create_engine
+from functools import lru_cache
+from sqlalchemy import DECIMAL, Column, Date, DateTime, ForeignKey, Index, Integer, String, create_engine, event, make_url, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.orm import relationship
+from sqlalchemy.pool import QueuePool
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATABASE_FILE = os.path.join(BASE_DIR, "project.db")
-DATABASE_URL = "sqlite:///" + DATABASE_FILE
-engine = create_engine(DATABASE_URL, echo=True)
+from config import Settings, settings
+
+def sqlite_pragmas(settings: Settings) -> dict:
+    return {
+        "journal_mode": settings.journal_mode,
+        "synchronous": settings.synchronous,
+        "cache_size": settings.cache_size,
+        "mmap_size": settings.mmap_size,
+        "busy_timeout": settings.busy_timeout,
+        "temp_store": settings.temp_store,
+    }
+
+def _install_pragmas(sync_engine, settings: Settings):
+    if sync_engine.dialect.name != "sqlite":
+        return
+    pragmas = sqlite_pragmas(settings)
+
+    @event.listens_for(sync_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def _engine_options(settings: Settings) -> dict:
+    options = {"echo": settings.echo}
+    # in-memory SQLite uses a single shared connection, there is no pool to size
+    if make_url(settings.database_url).database not in (None, "", ":memory:"):
+        options.update(pool_size=settings.pool_size, max_overflow=settings.max_overflow, pool_timeout=settings.pool_timeout)
+    return options
+
+def make_engine(settings: Settings):
+    engine = create_engine(settings.database_url, **_engine_options(settings))
+    _install_pragmas(engine, settings)
+    return engine
+
+def make_async_engine(settings: Settings):
+    # Imported only in async mode, it needs the greenlet and aiosqlite packages
+    from sqlalchemy.ext.asyncio import create_async_engine
+    url = settings.database_url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    async_engine = create_async_engine(url, **_engine_options(settings))
+    _install_pragmas(async_engine.sync_engine, settings)
+    return async_engine
+
+def _engine_facts(engine) -> dict:
+    report = {"url": engine.url.render_as_string(hide_password=True), "echo": engine.echo}
+    if isinstance(engine.pool, QueuePool):
+        report.update(pool_size=engine.pool.size(), max_overflow=engine.pool._max_overflow)
+    return report
+
+def _pragma_values(connection) -> dict:
+    return {name: connection.execute(text(f"PRAGMA {name}")).scalar() for name in sqlite_pragmas(settings)}
+
+def engine_report(engine) -> dict:
+    # What the database actually runs with, read back from a pooled connection
+    # (e.g. journal_mode silently stays "memory" for in-memory databases).
+    report = _engine_facts(engine)
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as connection:
+            report.update(_pragma_values(connection))
+    return report
+
+async def async_engine_report(async_engine) -> dict:
+    # engine_report() for the aiosqlite engine of async mode
+    report = _engine_facts(async_engine.sync_engine)
+    if async_engine.dialect.name == "sqlite":
+        async with async_engine.connect() as connection:
+            report.update(await connection.run_sync(_pragma_values))
+    return report
+
+# Engines are created on first use, so importing this module never touches the database
+@lru_cache(maxsize=None)
+def get_engine():
+    return make_engine(settings)
+
+@lru_cache(maxsize=None)
+def get_async_engine():
+    return make_async_engine(settings)
+
+@lru_cache(maxsize=None)
+def get_async_sessionmaker():
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+    return async_sessionmaker(get_async_engine(), expire_on_commit=False)
 Base = declarative_base()
 
 class Plants(Base):
@@ -16,20 +95,30 @@ class Plants(Base):
     name = Column(String, unique=True, nullable=False)
     location = Column(String)
     capacity = Column(Integer)
+    # optimistic concurrency: bumped by every update, checked through If-Match
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     plants_products = relationship("PlantsProducts", back_populates="plants")
     plants_materials = relationship("PlantsMaterials", back_populates="plants")
+    # AUTOINCREMENT: the id of a deleted row is never handed out again
+    __table_args__ = {"sqlite_autoincrement": True}
 
 class Products(Base):
     __tablename__ = 'Products'
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String, unique=True, nullable=False)
     description = Column(String, nullable=True)
-    category = Column(String, nullable=False)
-    price = Column(DECIMAL)
+    category = Column(String, nullable=False, index=True)
+    price = Column(DECIMAL, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     plants_products = relationship("PlantsProducts", back_populates="products")
     storage_products = relationship("StorageProducts", back_populates="products")
     products_materials = relationship("ProductsMaterials", back_populates="products")
     orders_products = relationship("OrdersProducts", back_populates="products")
+    __table_args__ = (
+        Index("ix_Products_category_price", "category", "price"),
+        Index("ix_Products_category_name", "category", "name"),
+        {"sqlite_autoincrement": True},
+    )
 
 class Materials(Base):
     __tablename__ = 'Materials'
@@ -38,23 +127,34 @@ class Materials(Base):
     description = Column(String, nullable=True)
     unit = Column(String, nullable=True)
     cost = Column(DECIMAL)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     plants_materials = relationship("PlantsMaterials", back_populates="materials")
     storage_materials = relationship("StorageMaterials", back_populates="materials")
     products_materials = relationship("ProductsMaterials", back_populates="materials")
+    __table_args__ = {"sqlite_autoincrement": True}
 
 class Orders(Base):
     __tablename__ = 'Orders'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    order_date = Column(DateTime, nullable=False)
-    customer_name = Column(String, nullable=False)
-    status = Column(String, nullable=False)
+    order_date = Column(DateTime, nullable=False, index=True)
+    customer_name = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     orders_products = relationship("OrdersProducts", back_populates="orders")
+    __table_args__ = (
+        Index("ix_Orders_status_order_date", "status", "order_date"),
+        Index("ix_Orders_customer_name_order_date", "customer_name", "order_date"),
+        Index("ix_Orders_status_customer_name", "status", "customer_name"),
+        Index("ix_Orders_customer_name_status", "customer_name", "status"),
+        Index("ix_Orders_status_customer_name_order_date", "status", "customer_name", "order_date"),
+        {"sqlite_autoincrement": True},
+    )
 
 class PlantsProducts(Base):
     __tablename__ = 'PlantsProducts'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    plant_id = Column(Integer, ForeignKey('Plants.id'))
-    product_id = Column(Integer, ForeignKey('Products.id'))
+    plant_id = Column(Integer, ForeignKey('Plants.id'), index=True)
+    product_id = Column(Integer, ForeignKey('Products.id'), index=True)
     quantity = Column(DECIMAL)
     plants = relationship("Plants", back_populates="plants_products")
     products = relationship("Products", back_populates="plants_products")
@@ -62,8 +162,8 @@ class PlantsProducts(Base):
 class ProductsMaterials(Base):
     __tablename__ = 'ProductsMaterials'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    product_id = Column(Integer, ForeignKey('Products.id'))
-    material_id = Column(Integer, ForeignKey('Materials.id'))
+    product_id = Column(Integer, ForeignKey('Products.id'), index=True)
+    material_id = Column(Integer, ForeignKey('Materials.id'), index=True)
     quantity = Column(DECIMAL)
     products = relationship("Products", back_populates="products_materials")
     materials = relationship("Materials", back_populates="products_materials")
@@ -71,8 +171,8 @@ class ProductsMaterials(Base):
 class PlantsMaterials(Base):
     __tablename__ = 'PlantsMaterials'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    plant_id = Column(Integer, ForeignKey('Plants.id'))
-    material_id = Column(Integer, ForeignKey('Materials.id'))
+    plant_id = Column(Integer, ForeignKey('Plants.id'), index=True)
+    material_id = Column(Integer, ForeignKey('Materials.id'), index=True)
     quantity = Column(DECIMAL)
     materials = relationship("Materials", back_populates="plants_materials")
     plants = relationship("Plants", back_populates="plants_materials")
@@ -80,126 +180,202 @@ class PlantsMaterials(Base):
 class OrdersProducts(Base):
     __tablename__ = 'OrdersProducts'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    order_id = Column(Integer, ForeignKey('Orders.id'))
-    product_id = Column(Integer, ForeignKey('Products.id'))
+    order_id = Column(Integer, ForeignKey('Orders.id'), index=True)
+    product_id = Column(Integer, ForeignKey('Products.id'), index=True)
     quantity = Column(Integer)
     products = relationship("Products", back_populates="orders_products")
     orders = relationship("Orders", back_populates="orders_products")
+    __table_args__ = (
+        # covers the order -> lines join of the revenue reports
+        Index("ix_OrdersProducts_order_id_product_id_quantity", "order_id", "product_id", "quantity"),
+    )
 
 class StorageProducts(Base):
     __tablename__ = 'StorageProducts'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    product_id = Column(Integer, ForeignKey('Products.id'))
+    product_id = Column(Integer, ForeignKey('Products.id'), index=True)
     quantity = Column(Integer)
     products = relationship("Products", back_populates="storage_products")
 
 class StorageMaterials(Base):
     __tablename__ = 'StorageMaterials'
     id = Column(Integer, primary_key=True, autoincrement=True)
-    material_id = Column(Integer, ForeignKey('Materials.id'))
+    material_id = Column(Integer, ForeignKey('Materials.id'), index=True)
     quantity = Column(Integer)
     materials = relationship("Materials", back_populates="storage_materials")
 
-# 🔧 Crearea bazei de date
-try:
-    Base.metadata.create_all(engine)
-    print("Tabelele au fost create cu succes!")
-except Exception as e:
-    print(f"Eroare la crearea tabelelor: {e}")
-
-# ✅ Popularea bazei de date
-Session = sessionmaker(bind=engine)
-session = Session()
-
-plants = [
-    Plants(name='Green Valley Plant', location='Springfield, IL', capacity=1000),
-    Plants(name='Herbal Remedies Factory', location='Madison, WI', capacity=1500),
-    Plants(name='Natural Extracts Co.', location='Boulder, CO', capacity=2000),
-    Plants(name='Pure Essence Plants', location='Austin, TX', capacity=1200),
-    Plants(name='Botanical Ingredients Inc.', location='Seattle, WA', capacity=1800),
-]
-session.add_all(plants)
-
-products = [
-    Products(name='Herbal Tea', description='A soothing herbal tea blend.', category='Beverage', price=5.99),
-    Products(name='Natural Shampoo', description='Shampoo made from natural ingredients.', category='Cosmetics', price=12.99),
-    Products(name='Essential Oil', description='Pure essential oil for aromatherapy.', category='Aromatherapy', price=15.99),
-    Products(name='Herbal Extract', description='Concentrated herbal extract for health benefits.', category='Supplements', price=20.99),
-    Products(name='Organic Soap', description='Handmade organic soap with natural ingredients.', category='Cosmetics', price=7.49),
-]
-session.add_all(products)
-
-plants_products = [
-    PlantsProducts(plant_id=1, product_id=1, quantity=200),
-    PlantsProducts(plant_id=1, product_id=2, quantity=150),
-    PlantsProducts(plant_id=2, product_id=3, quantity=300),
-    PlantsProducts(plant_id=3, product_id=4, quantity=100),
-    PlantsProducts(plant_id=4, product_id=5, quantity=250),
-]
-session.add_all(plants_products)
-
-materials = [
-    Materials(name='Chamomile', description='Dried chamomile flowers.', unit='grams', cost=2.50),
-    Materials(name='Lavender', description='Dried lavender flowers.', unit='grams', cost=3.00),
-    Materials(name='Coconut Oil', description='Organic coconut oil.', unit='liters', cost=10.00),
-    Materials(name='Aloe Vera', description='Fresh aloe vera gel.', unit='liters', cost=8.00),
-    Materials(name='Olive Oil', description='Extra virgin olive oil.', unit='liters', cost=12.00),
-]
-session.add_all(materials)
-
-products_materials = [
-    ProductsMaterials(product_id=1, material_id=1, quantity=50),
-    ProductsMaterials(product_id=2, material_id=3, quantity=30),
-    ProductsMaterials(product_id=3, material_id=2, quantity=20),
-    ProductsMaterials(product_id=4, material_id=4, quantity=25),
-    ProductsMaterials(product_id=5, material_id=5, quantity=10),
-]
-session.add_all(products_materials)
-
-plants_materials = [
-    PlantsMaterials(plant_id=1, material_id=1, quantity=100),
-    PlantsMaterials(plant_id=2, material_id=2, quantity=80),
-    PlantsMaterials(plant_id=3, material_id=3, quantity=150),
-    PlantsMaterials(plant_id=4, material_id=4, quantity=90),
-    PlantsMaterials(plant_id=5, material_id=5, quantity=120),
-]
-session.add_all(plants_materials)
-
-storage_products = [
-    StorageProducts(product_id=1, quantity=500),
-    StorageProducts(product_id=2, quantity=300),
-    StorageProducts(product_id=3, quantity=400),
-    StorageProducts(product_id=4, quantity=200),
-    StorageProducts(product_id=5, quantity=600),
-]
-session.add_all(storage_products)
-
-storage_materials = [
-    StorageMaterials(material_id=1, quantity=150),
-    StorageMaterials(material_id=2, quantity=100),
-    StorageMaterials(material_id=3, quantity=200),
-    StorageMaterials(material_id=4, quantity=180),
-    StorageMaterials(material_id=5, quantity=220),
-]
-session.add_all(storage_materials)
-
-orders = [
-    Orders(order_date=datetime(2023, 1, 15), customer_name='Alice Johnson', status='Completed'),
-    Orders(order_date=datetime(2023, 2, 20), customer_name='Bob Smith', status='Pending'),
-    Orders(order_date=datetime(2023, 3, 5), customer_name='Charlie Brown', status='Shipped'),
-    Orders(order_date=datetime(2023, 4, 10), customer_name='Diana Prince', status='Completed'),
-    Orders(order_date=datetime(2023, 5, 25), customer_name='Ethan Hunt', status='Cancelled'),
-]
-session.add_all(orders)
-
-orders_products = [
-    OrdersProducts(order_id=1, product_id=1, quantity=2),
-    OrdersProducts(order_id=1, product_id=3, quantity=1),
-    OrdersProducts(order_id=2, product_id=2, quantity=3),
-    OrdersProducts(order_id=3, product_id=4, quantity=2),
-    OrdersProducts(order_id=4, product_id=5, quantity=5),
-]
-session.add_all(orders_products)
-
-session.commit()
-session.close()
\ No newline at end of file
+class TableVersions(Base):
+    # Monotonic change counter per table, bumped by the triggers of
+    # table_version_ddl() in the transaction of every write, whatever made it
+    # (API, seed, raw SQL); used for ETags on the read routes
+    __tablename__ = 'TableVersions'
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+def search_ddl(table: str, columns=("name", "description")) -> list:
+    # FTS5 index over the text columns of a table ("external content": the
+    # index stores only tokens, the text itself stays in the base table),
+    # kept in sync by triggers so that every write path - ORM, bulk, raw SQL -
+    # updates it in the same transaction
+    fts = f"{table}Search"
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    return [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5({names}, content=\'{table}\', '
+        f"content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        # name matches weigh more than description matches
+        f'INSERT INTO "{fts}"("{fts}", rank) VALUES (\'rank\', \'bm25(10.0, 1.0)\')',
+        f'CREATE TRIGGER IF NOT EXISTS "{fts}_ai" AFTER INSERT ON "{table}" BEGIN '
+        f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new.id, {new}); END',
+        f'CREATE TRIGGER IF NOT EXISTS "{fts}_ad" AFTER DELETE ON "{table}" BEGIN '
+        f'INSERT INTO "{fts}"("{fts}", rowid, {names}) VALUES (\'delete\', old.id, {old}); END',
+        f'CREATE TRIGGER IF NOT EXISTS "{fts}_au" AFTER UPDATE OF {names} ON "{table}" BEGIN '
+        f'INSERT INTO "{fts}"("{fts}", rowid, {names}) VALUES (\'delete\', old.id, {old}); '
+        f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new.id, {new}); END',
+    ]
+
+SEARCH_TABLES = ("Products", "Materials")
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_search_tables(metadata, connection, **kw):
+    for table in SEARCH_TABLES:
+        for statement in search_ddl(table):
+            connection.exec_driver_sql(statement)
+
+class DailySales(Base):
+    # Order lines summed per day x product x order status, kept up to date by
+    # the triggers of rollup_ddl(); revenue is quantity x the current price,
+    # so it is computed when reading and price changes need no maintenance
+    __tablename__ = 'DailySales'
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    status = Column(String, primary_key=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+
+def rollup_ddl() -> list:
+    # Every change to Orders or OrdersProducts applies its delta to DailySales
+    # in the same transaction. order_count counts orders, not lines: it only
+    # moves when the first line of a product is added to an order or the last
+    # one is removed.
+    add_line = (
+        'INSERT INTO "DailySales"(day, product_id, status, quantity, order_count) '
+        'SELECT date(o.order_date), new.product_id, o.status, coalesce(new.quantity, 0), '
+        '(SELECT count(*) = 1 FROM "OrdersProducts" WHERE order_id = new.order_id AND product_id = new.product_id) '
+        'FROM "Orders" o WHERE o.id = new.order_id AND new.product_id IS NOT NULL '
+        'ON CONFLICT(day, product_id, status) DO UPDATE SET '
+        'quantity = quantity + excluded.quantity, order_count = order_count + excluded.order_count;'
+    )
+    remove_line = (
+        'UPDATE "DailySales" SET quantity = quantity - coalesce(old.quantity, 0), '
+        'order_count = order_count - NOT EXISTS '
+        '(SELECT 1 FROM "OrdersProducts" WHERE order_id = old.order_id AND product_id = old.product_id) '
+        'WHERE product_id = old.product_id AND (day, status) = '
+        '(SELECT date(order_date), status FROM "Orders" WHERE id = old.order_id);'
+    )
+
+    def add_order(ref):
+        return (
+            'INSERT INTO "DailySales"(day, product_id, status, quantity, order_count) '
+            f'SELECT date({ref}.order_date), product_id, {ref}.status, sum(coalesce(quantity, 0)), 1 '
+            f'FROM "OrdersProducts" WHERE order_id = {ref}.id AND product_id IS NOT NULL GROUP BY product_id '
+            'ON CONFLICT(day, product_id, status) DO UPDATE SET '
+            'quantity = quantity + excluded.quantity, order_count = order_count + excluded.order_count;'
+        )
+
+    def remove_order(ref):
+        return (
+            'UPDATE "DailySales" SET '
+            'quantity = quantity - (SELECT sum(coalesce(quantity, 0)) FROM "OrdersProducts" '
+            f'WHERE order_id = {ref}.id AND product_id = "DailySales".product_id), '
+            'order_count = order_count - 1 '
+            f'WHERE day = date({ref}.order_date) AND status = {ref}.status AND product_id IN '
+            f'(SELECT product_id FROM "OrdersProducts" WHERE order_id = {ref}.id);'
+        )
+
+    prune = 'DELETE FROM "DailySales" WHERE quantity = 0 AND order_count = 0;'
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "DailySales_line_ai" AFTER INSERT ON "OrdersProducts" BEGIN {add_line} END',
+        f'CREATE TRIGGER IF NOT EXISTS "DailySales_line_ad" AFTER DELETE ON "OrdersProducts" BEGIN {remove_line} {prune} END',
+        # same order and product: only the quantity moves
+        'CREATE TRIGGER IF NOT EXISTS "DailySales_line_au_quantity" AFTER UPDATE OF quantity ON "OrdersProducts" '
+        'WHEN old.order_id IS new.order_id AND old.product_id IS new.product_id BEGIN '
+        'UPDATE "DailySales" SET quantity = quantity - coalesce(old.quantity, 0) + coalesce(new.quantity, 0) '
+        'WHERE product_id = new.product_id AND (day, status) = '
+        '(SELECT date(order_date), status FROM "Orders" WHERE id = new.order_id); END',
+        'CREATE TRIGGER IF NOT EXISTS "DailySales_line_au_move" AFTER UPDATE OF order_id, product_id ON "OrdersProducts" '
+        f'WHEN old.order_id IS NOT new.order_id OR old.product_id IS NOT new.product_id BEGIN {remove_line} {add_line} {prune} END',
+        # lines left behind by a deleted order count again if its id is reused
+        f'CREATE TRIGGER IF NOT EXISTS "DailySales_order_ai" AFTER INSERT ON "Orders" BEGIN {add_order("new")} END',
+        f'CREATE TRIGGER IF NOT EXISTS "DailySales_order_ad" AFTER DELETE ON "Orders" BEGIN {remove_order("old")} {prune} END',
+        'CREATE TRIGGER IF NOT EXISTS "DailySales_order_au" AFTER UPDATE OF order_date, status ON "Orders" '
+        'WHEN date(old.order_date) IS NOT date(new.order_date) OR old.status IS NOT new.status BEGIN '
+        f'{remove_order("old")} {add_order("new")} {prune} END',
+    ]
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_rollup_triggers(metadata, connection, **kw):
+    for statement in rollup_ddl():
+        connection.exec_driver_sql(statement)
+
+class ChangeLog(Base):
+    # Append-only feed of the row changes of CHANGE_TABLES, one entry per
+    # inserted, updated or deleted row, written by the triggers of
+    # changelog_ddl() in the transaction of the change itself. AUTOINCREMENT
+    # keeps seq strictly increasing: a number is never handed out twice, even
+    # after the newest entries are deleted.
+    __tablename__ = 'ChangeLog'
+    __table_args__ = {"sqlite_autoincrement": True}
+    seq = Column(Integer, primary_key=True)
+    entity = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    version = Column(Integer)
+    changed_at = Column(DateTime, nullable=False)  # UTC
+
+def changelog_ddl(table: str) -> list:
+    # entity is the name used by the routes ("plants", "orders", ...); version
+    # is the row version after the change, or the last one for a delete
+    entity = table.lower()
+    now = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+    def log(op, ref):
+        return (
+            'INSERT INTO "ChangeLog"(entity, row_id, op, version, changed_at) '
+            f"VALUES ('{entity}', {ref}.id, '{op}', {ref}.version, {now});"
+        )
+
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "ChangeLog_{table}_ai" AFTER INSERT ON "{table}" BEGIN {log("insert", "new")} END',
+        f'CREATE TRIGGER IF NOT EXISTS "ChangeLog_{table}_au" AFTER UPDATE ON "{table}" BEGIN {log("update", "new")} END',
+        f'CREATE TRIGGER IF NOT EXISTS "ChangeLog_{table}_ad" AFTER DELETE ON "{table}" BEGIN {log("delete", "old")} END',
+    ]
+
+CHANGE_TABLES = ("Plants", "Products", "Materials", "Orders")
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_changelog_triggers(metadata, connection, **kw):
+    for table in CHANGE_TABLES:
+        for statement in changelog_ddl(table):
+            connection.exec_driver_sql(statement)
+
+def table_version_ddl(table: str) -> list:
+    # Every inserted, updated or deleted row moves the counter of its table.
+    # A counter starts at the current time in milliseconds rather than 1, so
+    # that a recreated database does not hand out the ETags of the old one.
+    bump = (
+        'INSERT INTO "TableVersions"(name, version) '
+        f"VALUES ('{table}', CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)) "
+        'ON CONFLICT(name) DO UPDATE SET version = version + 1;'
+    )
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS "TableVersions_{table}_{suffix}" AFTER {event} ON "{table}" BEGIN {bump} END'
+        for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE"))
+    ]
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_table_version_triggers(metadata, connection, **kw):
+    for table in CHANGE_TABLES:
+        for statement in table_version_ddl(table):
+            connection.exec_driver_sql(statement)
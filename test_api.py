@@ -0,0 +1,160 @@
+from datetime import datetime
+
+import bench
+from rollup import check_rollup
+from sql import Orders, OrdersProducts, PlantsProducts, ProductsMaterials, StorageProducts
+
+# Behaviour of the API routes, against the database of the `client` fixture
+# (see conftest.py). Each test creates the rows it relies on, under names of
+# its own, so that the tests do not depend on each other.
+
+
+def test_cold_start_stays_fast():
+    # Import plus first request, in a fresh process; the bound is generous,
+    # it only catches imports that do work again (schema creation, seeding)
+    result = bench.run_worker("coldstart", {"DB_MODE": "sync"}, [])
+    assert result["first_request_ms"] < 5000
+
+
+def test_cursor_paging_returns_every_row_once_in_order(client):
+    prices = [5, 3, 9, 3, 7, 1, 3]
+    payloads = [{"name": f"Paging product {i}", "category": "Paging", "price": price} for i, price in enumerate(prices)]
+    assert client.post("/products/bulk", json=payloads).status_code == 200
+    for sort in ("price", "-price", "id", "-id"):
+        seen, cursor = [], None
+        while True:
+            params = {"category": "Paging", "sort": sort, "limit": 3}
+            if cursor is not None:
+                params["after"] = cursor
+            page = client.get("/products/", params=params).json()
+            seen.extend(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        column = sort.lstrip("-")
+        expected = sorted(seen, key=lambda item: (item[column], item["id"]), reverse=sort.startswith("-"))
+        assert len(seen) == len(prices)
+        assert len({item["id"] for item in seen}) == len(prices)
+        assert seen == expected
+
+
+def test_unsupported_sort_is_rejected(client):
+    response = client.get("/products/", params={"price_min": 1, "sort": "name"})
+    assert response.status_code == 400
+
+
+def test_list_etag_answers_304_until_a_write(client):
+    first = client.get("/plants/")
+    etag = first.headers["etag"]
+    assert client.get("/plants/", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/plants/", json={"name": "Etag plant"})
+    assert client.get("/plants/", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_item_etag_and_if_match(client):
+    plant_id = client.post("/plants/", json={"name": "If-Match plant", "capacity": 1}).json()["id"]
+    etag = client.get(f"/plants/{plant_id}").headers["etag"]
+    assert client.get(f"/plants/{plant_id}", headers={"If-None-Match": etag}).status_code == 304
+
+    updated = client.put(f"/plants/{plant_id}", json={"capacity": 2}, headers={"If-Match": etag})
+    assert updated.status_code == 200
+    assert updated.json()["version"] == 2
+    # the old ETag is stale now, for writes and for conditional reads
+    assert client.put(f"/plants/{plant_id}", json={"capacity": 3}, headers={"If-Match": etag}).status_code == 412
+    assert client.delete(f"/plants/{plant_id}", headers={"If-Match": etag}).status_code == 412
+    assert client.get(f"/plants/{plant_id}", headers={"If-None-Match": etag}).status_code == 200
+    assert client.get(f"/plants/{plant_id}").json()["capacity"] == 2
+
+
+def test_upsert_counts(client):
+    plants = [{"name": "Upsert plant A", "capacity": 1}, {"name": "Upsert plant B", "capacity": 1}]
+    assert client.post("/plants/upsert", json=plants).json() == {"inserted": 2, "updated": 0, "unchanged": 0}
+    plants[1]["capacity"] = 2
+    plants.append({"name": "Upsert plant C"})
+    assert client.post("/plants/upsert", json=plants).json() == {"inserted": 1, "updated": 1, "unchanged": 1}
+
+
+def test_concurrent_upserts_do_not_fail(client):
+    # Every upsert transaction starts with a write, so concurrent ones queue
+    # for the write lock instead of failing to upgrade a read
+    from concurrent.futures import ThreadPoolExecutor
+
+    def upsert(n):
+        plants = [{"name": f"Concurrent upsert plant {i}", "capacity": n} for i in range(20)]
+        return client.post("/plants/upsert", json=plants).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert set(pool.map(upsert, range(32))) == {200}
+
+
+def test_requests_run_in_the_configured_database_mode(client):
+    # CI runs this module with DB_MODE=sync and DB_MODE=async
+    import sql
+    from config import settings
+
+    assert client.get("/plants/").status_code == 200
+    assert (sql.get_async_engine.cache_info().currsize > 0) == (settings.db_mode == "async")
+
+
+def test_plain_filters_pick_a_sort_an_index_can_serve(client):
+    # Range and multi-value filters without a sort are read in the order of
+    # the filtered column, and page through every match
+    payloads = [{"name": f"Default sort product {i}", "category": "Default sort", "price": 500 + i % 3} for i in range(5)]
+    assert client.post("/products/bulk", json=payloads).status_code == 200
+    for path in (
+        "/orders/?status=Pending,Shipped",
+        "/orders/?order_date_from=2023-01-01T00:00:00",
+        "/products/?price_min=1",
+        "/products/?category=Cosmetics,Beverage",
+    ):
+        assert client.get(path).status_code == 200, path
+    seen, cursor = [], None
+    while True:
+        params = {"price_min": 500, "limit": 2}
+        if cursor is not None:
+            params["after"] = cursor
+        page = client.get("/products/", params=params).json()
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert [item["name"] for item in seen] == [
+        item["name"] for item in sorted(seen, key=lambda item: (item["price"], item["id"]))
+    ]
+    assert {item["name"] for item in payloads} <= {item["name"] for item in seen}
+
+
+def test_deleted_order_leaves_nothing_to_a_new_one(client, db):
+    # The id of a deleted order is not reused, and its lines no longer point at it
+    order = {"order_date": "2024-02-01T10:00:00", "customer_name": "Deleted order customer", "status": "Pending"}
+    order_id = client.post("/orders/", json=order).json()["id"]
+    line = OrdersProducts(order_id=order_id, product_id=1, quantity=2)
+    db.add(line)
+    db.commit()
+    assert client.delete(f"/orders/{order_id}").status_code == 200
+    new_id = client.post("/orders/", json=order).json()["id"]
+    assert new_id > order_id
+    assert client.get(f"/orders/{new_id}/full").json()["lines"] == []
+    db.refresh(line)
+    assert line.order_id is None
+
+
+def test_deleting_a_product_detaches_its_rows(client, db):
+    product_id = client.post("/products/", json={"name": "Detached product", "category": "Detached", "price": 3}).json()["id"]
+    order = Orders(order_date=datetime(2024, 2, 2), customer_name="Detached customer", status="Shipped")
+    db.add(order)
+    db.flush()
+    children = [
+        OrdersProducts(order_id=order.id, product_id=product_id, quantity=4),
+        StorageProducts(product_id=product_id, quantity=10),
+        PlantsProducts(plant_id=1, product_id=product_id, quantity=5),
+        ProductsMaterials(product_id=product_id, material_id=1, quantity=1),
+    ]
+    db.add_all(children)
+    db.commit()
+    assert client.delete(f"/products/{product_id}").status_code == 200
+    for child in children:
+        db.refresh(child)
+        assert child.product_id is None
+    assert check_rollup(db.connection()) == []
+    assert client.delete(f"/products/{product_id}").status_code == 404
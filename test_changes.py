@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import func, select
+
+from config import settings
+from sql import ChangeLog
+
+# GET /changes: the ChangeLog written by the triggers of changelog_ddl (see
+# sql.py), and the long-poll woken by the commits of this process (see
+# changes.py).
+
+
+def last_seq(db):
+    return db.scalar(select(func.coalesce(func.max(ChangeLog.seq), 0)))
+
+
+def test_each_write_logs_one_change_in_order(client, db):
+    since = last_seq(db)
+    material_id = client.post("/materials/", json={"name": "Logged material", "unit": "kg", "cost": 1}).json()["id"]
+    assert client.put(f"/materials/{material_id}", json={"cost": 2}).status_code == 200
+    assert client.delete(f"/materials/{material_id}").status_code == 200
+
+    page = client.get("/changes", params={"since": since}).json()
+    changes = page["changes"]
+    assert [(change["entity"], change["row_id"], change["op"], change["version"]) for change in changes] == [
+        ("materials", material_id, "insert", 1),
+        ("materials", material_id, "update", 2),
+        ("materials", material_id, "delete", 2),
+    ]
+    seqs = [change["seq"] for change in changes]
+    assert seqs == sorted(seqs) and seqs[0] > since
+    assert page["next_since"] == seqs[-1]
+    # paging with next_since picks up where the last page ended
+    assert client.get("/changes", params={"since": seqs[0], "limit": 1}).json()["changes"][0]["seq"] == seqs[1]
+    assert client.get("/changes", params={"since": seqs[-1]}).json() == {"changes": [], "next_since": seqs[-1]}
+
+
+def test_long_poll_returns_as_soon_as_a_change_is_committed(client, db):
+    since = last_seq(db)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        poll = pool.submit(client.get, "/changes", params={"since": since, "wait": 10})
+        time.sleep(0.3)
+        assert not poll.done()
+        plant_id = client.post("/plants/", json={"name": "Long-poll plant", "capacity": 1}).json()["id"]
+        committed = time.monotonic()
+        page = poll.result(timeout=10).json()
+        waited = time.monotonic() - committed
+    assert [(change["entity"], change["row_id"], change["op"]) for change in page["changes"]] == [
+        ("plants", plant_id, "insert"),
+    ]
+    # woken by the commit, not by the periodic re-read of the log
+    assert waited < settings.changes_poll_interval / 2
+
+
+def test_long_poll_without_changes_waits_out_its_time(client, db):
+    since = last_seq(db)
+    started = time.monotonic()
+    assert client.get("/changes", params={"since": since, "wait": 0.3}).json() == {"changes": [], "next_since": since}
+    assert time.monotonic() - started >= 0.3
@@ -0,0 +1,30 @@
+import importlib.util
+
+import pytest
+
+import bench
+
+# Concurrent single-row creates with GROUP_COMMIT=1, some of them repeating
+# the unique name of another: every caller gets its own row or a 409, and
+# each name is created exactly once (see bench.creates_worker).
+
+MODES = [
+    "sync",
+    pytest.param("async", marks=pytest.mark.skipif(
+        importlib.util.find_spec("aiosqlite") is None, reason="async mode needs aiosqlite",
+    )),
+]
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_grouped_creates_give_each_caller_its_row(mode):
+    result = bench.run_worker("creates", {"DB_MODE": mode, "GROUP_COMMIT": "1"}, [
+        "--entity", "plants", "--requests", "300", "--duplicates", "60", "--concurrency", "100",
+    ])
+    assert result["errors"] == 0
+    assert result["wrong_rows"] == 0
+    assert result["lost_or_doubled"] == 0
+    assert result["created"] == 240
+    assert result["rejected"] == 60
+    # the rows were written in batches, so rejections shared a transaction with other rows
+    assert result["mean_batch_size"] > 1
@@ -0,0 +1,72 @@
+import shutil
+import sqlite3
+from contextlib import closing
+from dataclasses import replace
+from pathlib import Path
+
+import pytest
+
+from config import settings
+from migrations import ENTITY_COLUMNS, create_or_migrate
+from sql import make_engine
+
+# A copy of project.db, which predates the migrations, brought up to date
+# against a database created from the models.
+
+
+def migrate_copy(database: Path, before=()):
+    # before: SQL run on the old schema, e.g. to leave rows behind
+    shutil.copy(Path(__file__).with_name("project.db"), database)
+    with sqlite3.connect(database) as connection:
+        for statement in before:
+            connection.execute(statement)
+    engine = make_engine(replace(settings, database_url=f"sqlite:///{database}"))
+    create_or_migrate(engine)
+    engine.dispose()
+    return sqlite3.connect(database)
+
+
+def schema(connection):
+    return {
+        (kind, name): " ".join((sql or "").split()) for kind, name, sql in connection.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE tbl_name IN (%s)" % ", ".join("?" * len(ENTITY_COLUMNS)),
+            list(ENTITY_COLUMNS),
+        )
+    }
+
+
+@pytest.fixture
+def fresh(tmp_path):
+    engine = make_engine(replace(settings, database_url=f"sqlite:///{tmp_path / 'fresh.db'}"))
+    create_or_migrate(engine)
+    engine.dispose()
+    with closing(sqlite3.connect(tmp_path / "fresh.db")) as connection:
+        yield connection
+
+
+def test_entity_tables_match_a_fresh_database(tmp_path, fresh):
+    with closing(migrate_copy(tmp_path / "migrated.db")) as migrated:
+        expected, actual = schema(fresh), schema(migrated)
+        assert migrated.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+        assert migrated.execute('SELECT count(*) FROM "Orders"').fetchone()[0] > 0
+    # the table definitions differ in layout only; indexes and triggers are the same
+    assert {key for key in actual if key[0] == "table"} == {key for key in expected if key[0] == "table"}
+    assert {key: sql for key, sql in actual.items() if key[0] != "table"} == {
+        key: sql for key, sql in expected.items() if key[0] != "table"
+    }
+    for table in ENTITY_COLUMNS:
+        assert "AUTOINCREMENT" in actual["table", table]
+
+
+def test_ids_of_rows_deleted_before_the_migration_are_not_reused(tmp_path):
+    # The newest order was deleted by the old code, which left its lines behind
+    with closing(migrate_copy(tmp_path / "migrated.db", before=[
+        'INSERT INTO "OrdersProducts"(order_id, product_id, quantity) SELECT max(id), 1, 3 FROM "Orders"',
+        'DELETE FROM "Orders" WHERE id = (SELECT max(id) FROM "Orders")',
+    ])) as migrated, migrated:
+        deleted = migrated.execute('SELECT max(order_id) FROM "OrdersProducts"').fetchone()[0]
+        new_id = migrated.execute(
+            'INSERT INTO "Orders"(order_date, customer_name, status) '
+            "VALUES ('2024-01-01 00:00:00', 'Migrated customer', 'Pending') RETURNING id"
+        ).fetchone()[0]
+    assert new_id > deleted
@@ -0,0 +1,24 @@
+import importlib.util
+
+import pytest
+
+import bench
+
+# Concurrency stress test of POST /orders/place: many orders race for a small
+# stock, and no product may end up oversold (see bench.place_worker).
+
+MODES = [
+    "sync",
+    pytest.param("async", marks=pytest.mark.skipif(
+        importlib.util.find_spec("aiosqlite") is None, reason="async mode needs aiosqlite",
+    )),
+]
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_concurrent_orders_never_oversell(mode):
+    result = bench.run_worker("place", {"DB_MODE": mode}, ["--requests", "200", "--concurrency", "50", "--stock", "20"])
+    assert result["errors"] == 0
+    assert result["oversold"] == 0
+    # the stock runs out part way, so both outcomes were exercised
+    assert result["placed"] > 0 and result["rejected"] > 0
@@ -0,0 +1,173 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import planning
+from sql import Materials, Orders, OrdersProducts, Plants, PlantsProducts, Products, ProductsMaterials, StorageMaterials
+
+# The planning services: material requirements against plain Python
+# computations over the seeded database of the `client` fixture, production
+# schedules over small hand-made plans in an `empty_db` (see conftest.py).
+
+
+def expected_requirements(db, order_ids=None, only_shortfalls=False):
+    orders = {
+        order.id for order in db.scalars(select(Orders))
+        if order.status != "Cancelled" and (order_ids is None or order.id in order_ids)
+    }
+    demand = {}
+    for line in db.scalars(select(OrdersProducts)):
+        if line.order_id in orders and line.product_id is not None:
+            demand[line.product_id] = demand.get(line.product_id, 0) + (line.quantity or 0)
+    required = {}
+    for entry in db.scalars(select(ProductsMaterials)):
+        if entry.product_id in demand and entry.material_id is not None:
+            required[entry.material_id] = required.get(entry.material_id, 0) + demand[entry.product_id] * float(entry.quantity or 0)
+    stock = {}
+    for row in db.scalars(select(StorageMaterials)):
+        stock[row.material_id] = stock.get(row.material_id, 0) + float(row.quantity or 0)
+    names = {material.id: (material.name, material.unit) for material in db.scalars(select(Materials))}
+    result = []
+    for material_id in sorted(required):
+        shortfall = max(required[material_id] - stock.get(material_id, 0), 0)
+        if only_shortfalls and not shortfall:
+            continue
+        result.append({
+            "material_id": material_id,
+            "name": names[material_id][0],
+            "unit": names[material_id][1],
+            "required": pytest.approx(required[material_id]),
+            "in_stock": pytest.approx(stock.get(material_id, 0)),
+            "shortfall": pytest.approx(shortfall),
+        })
+    return result
+
+
+def test_material_requirements_of_all_orders(db):
+    result = planning.material_requirements(db)
+    assert result
+    assert result == expected_requirements(db)
+
+
+def test_material_requirements_of_some_orders(db):
+    order_ids = [order_id for order_id in db.scalars(select(Orders.id).order_by(Orders.id).limit(2))]
+    assert planning.material_requirements(db, order_ids=order_ids) == expected_requirements(db, order_ids=set(order_ids))
+
+
+def test_material_requirements_of_no_orders(db):
+    assert planning.material_requirements(db, order_ids=[]) == []
+
+
+def test_material_requirements_only_shortfalls(db):
+    # A large order of a product with a bill of materials, left uncommitted
+    product_id = db.scalar(select(ProductsMaterials.product_id).where(ProductsMaterials.quantity > 0).limit(1))
+    order = Orders(customer_name="Shortfall customer", status="Pending", order_date=datetime(2024, 1, 1))
+    db.add(order)
+    db.flush()
+    db.add(OrdersProducts(order_id=order.id, product_id=product_id, quantity=1_000_000))
+    db.flush()
+    try:
+        result = planning.material_requirements(db, only_shortfalls=True)
+        assert result
+        assert result == expected_requirements(db, only_shortfalls=True)
+        assert all(row["shortfall"] > 0 for row in result)
+    finally:
+        db.rollback()
+
+
+START = datetime(2024, 3, 1)
+
+
+@pytest.fixture
+def plan(empty_db):
+    # Two plants making product A at 10 and 6 a day, plant 2 capped at 8 a
+    # day over all products; product B made by plant 2 only; product C by none
+    db = empty_db
+    plants = [Plants(name="Plant 1", capacity=100), Plants(name="Plant 2", capacity=8)]
+    products = [Products(name=name, category="Plan", price=1) for name in ("A", "B", "C")]
+    db.add_all(plants + products)
+    db.flush()
+    db.add_all([
+        PlantsProducts(plant_id=plants[0].id, product_id=products[0].id, quantity=10),
+        PlantsProducts(plant_id=plants[1].id, product_id=products[0].id, quantity=6),
+        PlantsProducts(plant_id=plants[1].id, product_id=products[1].id, quantity=5),
+    ])
+    db.commit()
+    return db, [plant.id for plant in plants], [product.id for product in products]
+
+
+def place(db, lines, order_date=START, status="Pending"):
+    order = Orders(customer_name="Plan customer", status=status, order_date=order_date)
+    db.add(order)
+    db.flush()
+    db.add_all([OrdersProducts(order_id=order.id, product_id=product_id, quantity=quantity)
+                for product_id, quantity in lines])
+    db.commit()
+    return order.id
+
+
+def per_bucket(schedule, key):
+    totals = {}
+    for assignment in schedule["assignments"]:
+        index = (assignment["bucket"],) + tuple(assignment[name] for name in key)
+        totals[index] = totals.get(index, 0) + assignment["quantity"]
+    return totals
+
+
+def test_schedule_keeps_to_rates_and_capacity(plan):
+    db, (plant_1, plant_2), (a, b, _) = plan
+    place(db, [(a, 45), (b, 12)])
+    place(db, [(b, 4)], order_date=START + timedelta(hours=1))
+    schedule = planning.schedule_production(db, start=START)
+
+    assert schedule["unscheduled"] == []
+    rates = {(plant_1, a): 10, (plant_2, a): 6, (plant_2, b): 5}
+    for (bucket, plant_id, product_id), quantity in per_bucket(schedule, ("plant_id", "product_id")).items():
+        assert quantity <= rates[plant_id, product_id] + 1e-9
+    for (bucket, plant_id), quantity in per_bucket(schedule, ("plant_id",)).items():
+        assert quantity <= {plant_1: 100, plant_2: 8}[plant_id] + 1e-9
+    made = per_bucket(schedule, ("line_id",))
+    lines = {line.id: line.quantity for line in db.scalars(select(OrdersProducts))}
+    for line_id, quantity in lines.items():
+        assert sum(total for (_, line), total in made.items() if line == line_id) == pytest.approx(quantity)
+    # the first order is due first, so its line of A takes both plants on day 0
+    assert per_bucket(schedule, ("plant_id", "product_id"))[0, plant_1, a] == 10
+    assert per_bucket(schedule, ("plant_id", "product_id"))[0, plant_2, a] == 6
+    assert all(assignment["bucket_start"] == START + timedelta(days=assignment["bucket"])
+               for assignment in schedule["assignments"])
+
+
+def test_schedule_is_deterministic(plan):
+    db, _, (a, b, _) = plan
+    for day in range(5):
+        place(db, [(a, 7 + day), (b, 3)], order_date=START + timedelta(days=day % 3))
+    assert planning.schedule_production(db, start=START) == planning.schedule_production(db, start=START)
+
+
+def test_schedule_reports_what_it_cannot_make(plan):
+    db, _, (a, b, c) = plan
+    order_id = place(db, [(a, 10), (b, 100), (c, 3)])
+    schedule = planning.schedule_production(db, start=START, horizon=5)
+
+    unscheduled = {line["product_id"]: line for line in schedule["unscheduled"]}
+    assert unscheduled[b]["reason"] == "does not fit in the horizon"
+    assert unscheduled[b]["quantity"] == pytest.approx(100 - 5 * 5)
+    assert unscheduled[c]["reason"] == "no plant makes this product"
+    assert unscheduled[c]["quantity"] == 3
+    assert a not in unscheduled
+    assert schedule["orders"] == [{
+        "order_id": order_id, "due": START + timedelta(days=7), "completion": None, "lateness_days": None,
+    }]
+
+
+def test_schedule_only_takes_the_given_statuses(plan):
+    db, _, (a, _, _) = plan
+    place(db, [(a, 5)], status="Shipped")
+    assert planning.schedule_production(db, start=START)["assignments"] == []
+
+
+def test_schedule_route_accepts_an_aware_start(client):
+    response = client.post("/planning/schedule", json={"start": "2023-01-01T02:00:00+02:00", "horizon": 3})
+    assert response.status_code == 200
+    assert response.json()["start"] == "2023-01-01T00:00:00"
@@ -0,0 +1,49 @@
+import shutil
+from dataclasses import replace
+from pathlib import Path
+
+import crud
+from config import settings
+from migrations import create_or_migrate
+from query_plans import LIST_FILTERS, check_query_plans
+from sql import Orders, Products, make_engine
+
+# `manage.py explain` as tests: the hot queries must use their indexes, both
+# on a database created from the models and on one brought up to date by the
+# migrations.
+
+
+def plan_problems(database: Path) -> dict:
+    engine = make_engine(replace(settings, database_url=f"sqlite:///{database}"))
+    try:
+        create_or_migrate(engine)
+        with engine.connect() as connection:
+            results = check_query_plans(connection)
+    finally:
+        engine.dispose()
+    return {name: problems for name, (plan, problems) in results.items() if problems}
+
+
+def test_hot_queries_use_their_indexes(tmp_path):
+    assert plan_problems(tmp_path / "fresh.db") == {}
+
+
+def test_migrated_database_plans_like_a_fresh_one(tmp_path):
+    # project.db predates the migrations
+    database = tmp_path / "migrated.db"
+    shutil.copy(Path(__file__).with_name("project.db"), database)
+    assert plan_problems(database) == {}
+
+
+def test_every_sort_works_with_one_equality_filter():
+    # The composite indexes behind these pairs are what the list routes
+    # promise; dropping one would turn its pairs into 400s
+    equality = {
+        Orders: [{}, {"status": ["Pending"]}, {"customer_name": "Alice Johnson"}],
+        Products: [{}, {"category": ["Electronics"]}],
+    }
+    for model, (build, _) in LIST_FILTERS.items():
+        for filters in equality[model]:
+            for sort in crud.SORTABLE[model]:
+                listing = crud.Listing(build(**filters), sort)
+                assert crud.index_order_available(model, listing), (model.__tablename__, filters, sort)
@@ -0,0 +1,86 @@
+import random
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, insert, select, update
+
+import reports
+from config import settings
+from migrations import create_or_migrate
+from rollup import check_rollup
+from sql import Orders, OrdersProducts, Products, make_engine
+
+# The DailySales triggers (rollup_ddl in sql.py) under a random mix of order
+# and line inserts, updates, moves and deletes, written straight to the
+# tables: after every step the rollup must equal a recomputation from the
+# order lines, and the reports read from either side must agree.
+
+STATUSES = ["Pending", "Shipped", "Cancelled"]
+DAYS = [datetime(2024, 1, 30, 9, 30) + timedelta(days=n, hours=n * 5) for n in range(4)]
+
+
+@pytest.fixture
+def connection(tmp_path):
+    engine = make_engine(replace(settings, database_url=f"sqlite:///{tmp_path / 'rollup.db'}"))
+    create_or_migrate(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Products), [
+            {"name": f"Rollup product {i}", "category": "Rollup", "price": 1.5 + i} for i in range(4)
+        ])
+        yield connection
+    engine.dispose()
+
+
+def random_step(connection, rng):
+    orders = connection.execute(select(Orders.id)).scalars().all()
+    lines = connection.execute(select(OrdersProducts.id)).scalars().all()
+    products = connection.execute(select(Products.id)).scalars().all()
+    step = rng.choice(["order", "order", "line", "line", "line", "quantity", "move", "status", "date",
+                       "delete line", "delete order"])
+    if step == "order" or not orders:
+        connection.execute(insert(Orders).values(
+            order_date=rng.choice(DAYS), customer_name="Rollup", status=rng.choice(STATUSES),
+        ))
+    elif step == "line" or not lines:
+        connection.execute(insert(OrdersProducts).values(
+            order_id=rng.choice(orders), product_id=rng.choice(products + [None]),
+            quantity=rng.choice([1, 2, 5, None]),
+        ))
+    elif step == "quantity":
+        connection.execute(update(OrdersProducts).where(OrdersProducts.id == rng.choice(lines))
+                           .values(quantity=rng.choice([0, 3, 7, None])))
+    elif step == "move":
+        values = rng.choice([{"order_id": rng.choice(orders)}, {"product_id": rng.choice(products)},
+                             {"order_id": rng.choice(orders), "product_id": rng.choice(products)}])
+        connection.execute(update(OrdersProducts).where(OrdersProducts.id == rng.choice(lines)).values(**values))
+    elif step == "status":
+        connection.execute(update(Orders).where(Orders.id == rng.choice(orders)).values(status=rng.choice(STATUSES)))
+    elif step == "date":
+        connection.execute(update(Orders).where(Orders.id == rng.choice(orders)).values(order_date=rng.choice(DAYS)))
+    elif step == "delete line":
+        connection.execute(delete(OrdersProducts).where(OrdersProducts.id == rng.choice(lines)))
+    else:
+        order_id = rng.choice(orders)
+        if rng.random() < 0.5:
+            connection.execute(delete(OrdersProducts).where(OrdersProducts.order_id == order_id))
+        connection.execute(delete(Orders).where(Orders.id == order_id))
+    return step
+
+
+def report(connection, build, group_by, exclude_cancelled):
+    rows = connection.execute(build(group_by, exclude_cancelled=exclude_cancelled)).mappings()
+    return [{**row, "revenue": pytest.approx(float(row["revenue"]))} for row in rows]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_rollup_follows_random_writes(connection, seed):
+    rng = random.Random(seed)
+    for number in range(300):
+        step = random_step(connection, rng)
+        assert check_rollup(connection) == [], f"after step {number} ({step})"
+    for group_by in (["product"], ["product", "month"], ["product", "category"]):
+        for exclude_cancelled in (True, False):
+            assert reports.uses_rollup(group_by)
+            assert report(connection, reports.rollup_statement, group_by, exclude_cancelled) == \
+                report(connection, reports.revenue_statement, group_by, exclude_cancelled)